@@ -0,0 +1,6 @@
+"""
+Бенчмарки бота на сгенерированных базах.
+
+Запускаются из корня репозитория, например: python -m bench.db_pool
+Реальный BOT_TOKEN не нужен — в Telegram бенчмарки не ходят.
+"""
@@ -0,0 +1,124 @@
+"""Общее для бенчмарков: подготовка окружения, генерация базы и сводка задержек."""
+
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+# main читает настройки при импорте
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.gettempdir(), "bench_bot.db"))
+
+import main  # noqa: E402
+
+CURATOR_TG_BASE = 900_000  # telegram_id кураторов: CURATOR_TG_BASE + idx
+STATUSES = ("pending", "accepted", "rejected")
+
+
+def temp_db_path(name: str) -> str:
+    return os.path.join(tempfile.mkdtemp(prefix="bench_"), name)
+
+
+async def open_pool(path: str, readers: int = main.DB_READERS) -> main.DBPool:
+    """Подменяет db_pool бота пулом на базе path и применяет схему."""
+    pool = main.DBPool(path, readers)
+    main.db_pool = pool
+    await pool.open()
+    await main.init_db()
+    main.user_state_cache.clear()
+    return pool
+
+
+async def generate_db(submissions: int, per_user: int = 10, curators: int = 20, seed: int = 1) -> Dict[str, int]:
+    """
+    Заполняет открытый db_pool кураторами, участниками и ответами.
+
+    У каждого участника per_user ответов на разные задания, статусы случайные, время создания —
+    за последние 10 дней. У решённых ответов есть время показа и решения. Фото- и видеоответы
+    получают строки в submission_media.
+    """
+    rnd = random.Random(seed)
+    users = max(submissions // per_user, 1)
+    now = datetime.utcnow()
+    task_ids = [t["id"] for t in main.TASKS]
+
+    curator_rows = [(idx, f"Куратор {idx}", CURATOR_TG_BASE + idx) for idx in range(1, curators + 1)]
+    user_rows = [(tg, f"Участник {tg}", f"Группа {tg % 50}", tg % curators + 1) for tg in range(1, users + 1)]
+    submission_rows, media_rows = [], []
+    sid = 0
+    for tg in range(1, users + 1):
+        for task_id in rnd.sample(task_ids, min(per_user, len(task_ids))):
+            if sid >= submissions:
+                break
+            sid += 1
+            kind = main.task_by_id(task_id)["type"]
+            status = rnd.choice(STATUSES)
+            created = now - timedelta(seconds=rnd.randint(60, 10 * 86400))
+            shown = decided = reviewer = None
+            if status != "pending":
+                shown = created + timedelta(seconds=rnd.randint(1, 6 * 3600))
+                decided = shown + timedelta(seconds=rnd.randint(5, 600))
+                reviewer = CURATOR_TG_BASE + tg % curators + 1
+            submission_rows.append((
+                sid, tg, task_id, status, kind, f"Ответ {sid}" if kind in ("text", "photo_text") else None,
+                created.isoformat(), (decided or created).isoformat(),
+                shown and shown.isoformat(), decided and decided.isoformat(), reviewer,
+            ))
+            if kind != "text":
+                parts = 3 if kind in ("photo_multi", "photo_video") else 1
+                media_kind = "video" if kind == "video" else "photo"
+                media_rows.extend((sid, n, media_kind, f"file_{sid}_{n}", f"u_{sid}_{n}") for n in range(parts))
+
+    async with main.db_pool.write() as db:
+        await db.execute("DELETE FROM curators")
+        await db.executemany("INSERT INTO curators (idx, fio, telegram_id) VALUES (?,?,?)", curator_rows)
+        await db.executemany("INSERT INTO users (tg_id, fio, acad_group, curator_idx) VALUES (?,?,?,?)", user_rows)
+        await db.executemany(
+            "INSERT INTO submissions (id, user_id, task_id, status, content_type, text, created_at, updated_at, "
+            "shown_at, decided_at, claimed_by) VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+            submission_rows)
+        await db.executemany(
+            "INSERT INTO submission_media (submission_id, ordinal, kind, file_id, file_unique_id) VALUES (?,?,?,?,?)",
+            media_rows)
+        for statement in main.COUNTER_REPAIRS.values():
+            await db.execute(statement)
+        await db.execute("UPDATE users SET points = accepted_count")
+    main.user_state_cache.clear()
+    return {"curators": curators, "users": users, "submissions": sid}
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    return {
+        "n": len(samples),
+        "p50": main.percentile(samples, 50),
+        "p95": main.percentile(samples, 95),
+        "p99": main.percentile(samples, 99),
+        "max": max(samples, default=0.0),
+    }
+
+
+def format_summary(title: str, samples: List[float], wall: Optional[float] = None) -> str:
+    st = latency_summary(samples)
+    line = (f"{title:<40} n={st['n']:<6} p50={st['p50'] * 1000:8.2f} мс  p95={st['p95'] * 1000:8.2f} мс  "
+            f"p99={st['p99'] * 1000:8.2f} мс  max={st['max'] * 1000:8.2f} мс")
+    if wall:
+        line += f"  {st['n'] / wall:8.0f}/с"
+    return line
+
+
+class Stopwatch:
+    """Копит длительности блоков with watch.measure() в samples; блоки могут идти параллельно."""
+
+    def __init__(self):
+        self.samples: List[float] = []
+
+    @contextmanager
+    def measure(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.append(time.perf_counter() - start)
@@ -0,0 +1,85 @@
+"""
+Задержка проверок на кнопке «Отправить ответ» (send_<id>) при 1000 одновременных участников.
+
+До пула: каждая проверка открывала своё соединение aiosqlite (приём закрыт?, участник и куратор,
+задание зачтено?, на проверке?, счётчик для суперзадания) — воспроизведено в legacy_send_checks.
+После: пул соединений и один запрос fetch_user_task_state, а также он же через кэш состояний.
+
+Запуск: python -m bench.db_pool [--users 1000] [--rounds 5]
+"""
+
+import argparse
+import asyncio
+import time
+
+import aiosqlite
+
+from bench.common import Stopwatch, format_summary, generate_db, main, open_pool, temp_db_path
+
+
+async def legacy_send_checks(path: str, user_id: int, task_id: int):
+    """Проверки on_send_answer до появления пула: отдельное соединение на каждый запрос."""
+    async with aiosqlite.connect(path) as db:
+        cur = await db.execute("SELECT value FROM meta WHERE key='submissions_closed'")
+        await cur.fetchone()
+    async with aiosqlite.connect(path) as db:
+        cur = await db.execute("SELECT curator_idx FROM users WHERE tg_id=?", (user_id,))
+        await cur.fetchone()
+    async with aiosqlite.connect(path) as db:
+        cur = await db.execute("SELECT COUNT(*) FROM submissions WHERE user_id=? AND task_id=? AND status='accepted'",
+                               (user_id, task_id))
+        await cur.fetchone()
+    async with aiosqlite.connect(path) as db:
+        cur = await db.execute("SELECT COUNT(*) FROM submissions WHERE user_id=? AND task_id=? AND status='pending'",
+                               (user_id, task_id))
+        await cur.fetchone()
+    async with aiosqlite.connect(path) as db:
+        cur = await db.execute("SELECT COUNT(*) FROM submissions WHERE user_id=? AND status='accepted'", (user_id,))
+        await cur.fetchone()
+
+
+async def pooled_send_checks(user_id: int, task_id: int):
+    state = await main.fetch_user_task_state(user_id)
+    state.task_block_reason(task_id)
+
+
+async def cached_send_checks(user_id: int, task_id: int):
+    state = await main.load_user_task_state(user_id)
+    state.task_block_reason(task_id)
+
+
+async def burst(users: int, rounds: int, click) -> tuple:
+    """rounds раз подряд все участники одновременно нажимают кнопку; возвращает задержки и общее время."""
+    watch = Stopwatch()
+
+    async def one(user_id: int):
+        with watch.measure():
+            await click(user_id, 14)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(one(user_id) for user_id in range(1, users + 1)))
+    return watch.samples, time.perf_counter() - start
+
+
+async def run(users: int, rounds: int):
+    path = temp_db_path("db_pool.db")
+    pool = await open_pool(path)
+    info = await generate_db(users * 5, per_user=5)
+    print(f"База: {info['users']} участников, {info['submissions']} ответов; {rounds} волн по {users} нажатий")
+
+    samples, wall = await burst(users, rounds, lambda u, t: legacy_send_checks(path, u, t))
+    print(format_summary("до: соединение на каждый запрос", samples, wall))
+    samples, wall = await burst(users, rounds, pooled_send_checks)
+    print(format_summary(f"после: пул ({pool.readers_count} читателей), 1 запрос", samples, wall))
+    samples, wall = await burst(users, rounds, cached_send_checks)
+    print(format_summary("после: пул + кэш состояний", samples, wall))
+    await pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.rounds))
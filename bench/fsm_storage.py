@@ -0,0 +1,70 @@
+"""
+Задержка операций FSM-хранилища: SQLiteStorage против MemoryStorage.
+
+На каждого из N участников — шаги, как при сборе ответа: set_state, update_data (id задания и медиа),
+get_state и get_data. Для SQLiteStorage отдельно меряются пакетная запись в базу (flush) и чтение
+после перезапуска, когда кэш пуст и состояние читается из fsm_states.
+
+Запуск: python -m bench.fsm_storage [--users 10000]
+"""
+
+import argparse
+import asyncio
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from bench.common import Stopwatch, format_summary, main, open_pool, temp_db_path
+
+STATE = "SubmitStates:waiting_for_answer"
+
+
+def storage_keys(users: int):
+    return [StorageKey(bot_id=1, chat_id=user_id, user_id=user_id) for user_id in range(1, users + 1)]
+
+
+async def exercise(storage, keys) -> dict:
+    ops = {name: Stopwatch() for name in ("set_state", "update_data", "get_state", "get_data")}
+    for n, key in enumerate(keys):
+        with ops["set_state"].measure():
+            await storage.set_state(key, STATE)
+        with ops["update_data"].measure():
+            await storage.update_data(key, {"task_id": 14, "collected_media": [f"photo:file_{n}_{i}" for i in range(5)]})
+    for key in keys:
+        with ops["get_state"].measure():
+            await storage.get_state(key)
+        with ops["get_data"].measure():
+            await storage.get_data(key)
+    return ops
+
+
+async def run(users: int):
+    pool = await open_pool(temp_db_path("fsm.db"))
+    keys = storage_keys(users)
+    print(f"{users} участников, по одной операции каждого вида на участника")
+
+    for name, ops in (("memory", await exercise(MemoryStorage(), keys)),
+                      ("sqlite", await exercise(main.fsm_storage, keys))):
+        for op, watch in ops.items():
+            print(format_summary(f"{name}: {op}", watch.samples))
+
+    start = time.perf_counter()
+    await main.fsm_storage.flush()
+    print(f"sqlite: flush {users} состояний одной транзакцией — {(time.perf_counter() - start) * 1000:.1f} мс")
+
+    # новый экземпляр с пустым кэшем — как после перезапуска бота
+    cold = main.SQLiteStorage(main.FSM_STATE_TTL, main.FSM_FLUSH_INTERVAL, main.FSM_CACHE_SIZE)
+    watch = Stopwatch()
+    for key in keys:
+        with watch.measure():
+            await cold.get_data(key)
+    print(format_summary("sqlite: get_data из базы (холодный кэш)", watch.samples))
+    await pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    args = parser.parse_args()
+    asyncio.run(run(args.users))
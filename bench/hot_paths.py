@@ -0,0 +1,245 @@
+"""
+Задержка горячих путей бота на базах разного размера.
+
+Для каждого размера (по умолчанию 1k, 10k и 100k ответов) создаётся своя база через generate_db,
+бот отправляет запросы в локальную заглушку Bot API (loadtest.fake_api), а хендлеры вызываются
+через dp.feed_update — с фильтрами, FSM и middleware, как при настоящих обновлениях. Меряются:
+tasks_keyboard_for_user, on_task_selected, receive_answer по типам ответов (photo_video — вместе с /done),
+send_next_submission_to_curator, curator_accept, build_ranking_values и /stats (cmd_stats).
+
+--save сохраняет p50/p95/p99 в JSON, --baseline сравнивает с сохранённым прогоном и завершается с кодом 1,
+если медиана какого-нибудь замера выросла больше чем в --threshold раз.
+
+Запуск: python -m bench.hot_paths [--sizes 1000,10000,100000] [--samples 200] [--save baseline.json]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import sys
+import time
+from typing import Dict, List
+
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+
+from bench.common import (CURATOR_TG_BASE, Stopwatch, format_summary, generate_db, latency_summary, main,
+                          open_pool, temp_db_path)
+from loadtest.fake_api import BOT_USER, FakeBotAPI
+
+ADMIN_ID = 1_000_000
+SUBMITTER_BASE = 10_000_000  # telegram_id новых участников, которые отправляют ответы во время замера
+ANSWER_TYPES = ("text", "photo", "video", "photo_text", "photo_multi", "photo_video")
+
+_ids = itertools.count(1)
+
+
+# ---- обновления ----
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"Участник {user_id}"}
+
+
+def message_update(user_id: int, **content) -> main.types.Update:
+    return main.types.Update.model_validate({"update_id": next(_ids), "message": {
+        "message_id": next(_ids), "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"}, "from": _user(user_id), **content,
+    }}, context={"bot": main.bot})
+
+
+def callback_update(user_id: int, data: str) -> main.types.Update:
+    return main.types.Update.model_validate({"update_id": next(_ids), "callback_query": {
+        "id": str(next(_ids)), "from": _user(user_id), "chat_instance": str(user_id), "data": data,
+        "message": {"message_id": next(_ids), "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"}, "from": BOT_USER, "text": "…"},
+    }}, context={"bot": main.bot})
+
+
+def photo(n: int, **extra) -> dict:
+    return {"photo": [{"file_id": f"photo_{n}", "file_unique_id": f"photo_{n}", "width": 1280, "height": 960}],
+            **extra}
+
+
+def video(n: int) -> dict:
+    return {"video": {"file_id": f"video_{n}", "file_unique_id": f"video_{n}", "width": 1280, "height": 720,
+                      "duration": 15}}
+
+
+def fsm(user_id: int) -> FSMContext:
+    return FSMContext(main.dp.storage, StorageKey(bot_id=main.bot.id, chat_id=user_id, user_id=user_id))
+
+
+async def feed(update: main.types.Update):
+    await main.dp.feed_update(main.bot, update)
+
+
+# ---- замеры ----
+class HotPaths:
+    def __init__(self, info: Dict[str, int], samples: int):
+        self.info = info
+        self.samples = samples
+        self.results: Dict[str, Stopwatch] = {}
+        self._submitters = itertools.count(SUBMITTER_BASE)
+
+    def watch(self, name: str) -> Stopwatch:
+        return self.results.setdefault(name, Stopwatch())
+
+    def users(self) -> List[int]:
+        """Разные участники из сгенерированной базы — у каждого свой, ещё не прогретый кэш состояния."""
+        step = max(self.info["users"] // self.samples, 1)
+        return [1 + (n * step) % self.info["users"] for n in range(self.samples)]
+
+    async def new_submitters(self, count: int) -> List[int]:
+        ids = [next(self._submitters) for _ in range(count)]
+        async with main.db_pool.write() as db:
+            await db.executemany(
+                "INSERT INTO users (tg_id, fio, acad_group, curator_idx) VALUES (?,?,?,?)",
+                [(tg, f"Участник {tg}", "Группа 1", tg % self.info["curators"] + 1) for tg in ids])
+        return ids
+
+    async def tasks_keyboard(self):
+        main.user_state_cache.clear()
+        watch = self.watch("tasks_keyboard_for_user")
+        for user_id in self.users():
+            with watch.measure():
+                await main.tasks_keyboard_for_user(user_id)
+
+    async def task_selected(self):
+        main.user_state_cache.clear()
+        watch = self.watch("on_task_selected")
+        for n, user_id in enumerate(self.users()):
+            update = callback_update(user_id, f"task_{n % 13 + 1}")
+            with watch.measure():
+                await feed(update)
+
+    async def receive_answers(self):
+        tasks = {kind: next(t["id"] for t in main.TASKS if t["type"] == kind) for kind in ANSWER_TYPES}
+        for kind, task_id in tasks.items():
+            watch = self.watch(f"receive_answer: {kind}")
+            submitters = await self.new_submitters(self.samples)
+            for n, user_id in enumerate(submitters):
+                state = fsm(user_id)
+                await state.update_data(task_id=task_id)
+                if kind == "photo_text":
+                    # фото и пояснение приходят разными сообщениями; замер — на втором, где ответ сохраняется
+                    await state.set_state(main.AnswerFSM.waiting_for_text)
+                    await state.update_data(photo={"kind": "photo", "file_id": f"photo_{n}"})
+                    update = message_update(user_id, text="Пояснение к фото")
+                else:
+                    await state.set_state(main.SubmitStates.waiting_for_answer)
+                    update = message_update(user_id, **{
+                        "text": {"text": f"Ответ {user_id}"},
+                        "photo": photo(n),
+                        "video": video(n),
+                        "photo_multi": photo(n, media_group_id=f"album_{user_id}"),
+                        "photo_video": photo(n),
+                    }[kind])
+                with watch.measure():
+                    await feed(update)
+            if kind == "photo_video":
+                # photo_video сохраняется не в receive_answer, а по /done, когда медиа уже собраны
+                watch = self.watch("handle_done_command: photo_video")
+                for user_id in submitters:
+                    update = message_update(user_id, text="/done")
+                    with watch.measure():
+                        await feed(update)
+        # альбомы сохраняются после паузы ALBUM_FLUSH_DELAY — дожидаемся их, чтобы не мешали следующим замерам
+        await main.media_groups.stop()
+
+    async def next_submission(self):
+        watch = self.watch("send_next_submission_to_curator")
+        curators = [CURATOR_TG_BASE + idx for idx in range(1, self.info["curators"] + 1)]
+        for n in range(self.samples):
+            with watch.measure():
+                await main.send_next_submission_to_curator(curators[n % len(curators)])
+
+    async def accept(self):
+        async with main.db_pool.read() as db:
+            cur = await db.execute(
+                "SELECT s.id, c.telegram_id FROM submissions s JOIN users u ON u.tg_id = s.user_id "
+                "JOIN curators c ON c.idx = u.curator_idx WHERE s.status = 'pending' AND s.claimed_by IS NULL "
+                "ORDER BY s.id LIMIT ?", (self.samples,))
+            pending = await cur.fetchall()
+        watch = self.watch("curator_accept")
+        for submission_id, curator_tg in pending:
+            update = callback_update(curator_tg, f"cur_accept_{submission_id}")
+            with watch.measure():
+                await feed(update)
+
+    async def ranking(self):
+        watch = self.watch("build_ranking_values")
+        for _ in range(max(self.samples // 20, 3)):
+            with watch.measure():
+                await main.build_ranking_values()
+
+    async def stats(self):
+        watch = self.watch("/stats")
+        for _ in range(max(self.samples // 20, 3)):
+            main._curator_stats = None  # без кэша — каждый раз полный пересчёт
+            update = message_update(ADMIN_ID, text="/stats")
+            with watch.measure():
+                await feed(update)
+
+
+async def run_size(size: int, samples: int) -> Dict[str, Dict[str, float]]:
+    pool = await open_pool(temp_db_path(f"hot_paths_{size}.db"))
+    info = await generate_db(size)
+    print(f"\nБаза: {info['submissions']} ответов, {info['users']} участников, {info['curators']} кураторов")
+    paths = HotPaths(info, samples)
+    for step in (paths.tasks_keyboard, paths.task_selected, paths.receive_answers, paths.next_submission,
+                 paths.accept, paths.ranking, paths.stats):
+        await step()
+    await main.review_prefetcher.stop()
+    await pool.close()
+    for name, watch in paths.results.items():
+        print(format_summary(name, watch.samples))
+    return {name: latency_summary(watch.samples) for name, watch in paths.results.items()}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """Печатает изменение медиан относительно baseline; False, если что-то замедлилось больше threshold раз."""
+    ok = True
+    print(f"\nСравнение с базовым прогоном (порог ×{threshold}):")
+    for size, cases in results.items():
+        for name, st in cases.items():
+            before = baseline.get(size, {}).get(name)
+            if not before or not before["p50"]:
+                continue
+            ratio = st["p50"] / before["p50"]
+            regressed = ratio > threshold
+            ok = ok and not regressed
+            print(f"{'❌' if regressed else '✅'} {size:>7} {name:<40} p50 {before['p50'] * 1000:8.2f} → "
+                  f"{st['p50'] * 1000:8.2f} мс (×{ratio:.2f})")
+    return ok
+
+
+async def run(sizes: List[int], samples: int) -> dict:
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)  # без строки на каждое обновление
+    api = FakeBotAPI()
+    main.bot.session.api = TelegramAPIServer.from_base(await api.start())
+    main.ADMIN_IDS.append(ADMIN_ID)
+    try:
+        return {str(size): await run_size(size, samples) for size in sizes}
+    finally:
+        await main.bot.session.close()
+        await api.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000", help="размеры баз в ответах, через запятую")
+    parser.add_argument("--samples", type=int, default=200, help="замеров на каждый путь")
+    parser.add_argument("--save", help="сохранить результаты в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=1.5, help="допустимый рост медианы, во сколько раз")
+    args = parser.parse_args()
+    results = asyncio.run(run([int(s) for s in args.sizes.split(",")], args.samples))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            if not compare(results, json.load(f), args.threshold):
+                sys.exit(1)
@@ -0,0 +1,66 @@
+"""
+Сборка рейтинга для Google Sheets: N+1 запросов против одного агрегирующего RANKING_SQL.
+
+До: список участников и отдельный SELECT зачтённых заданий на каждого, сортировка и места в Python
+(воспроизведено в legacy_ranking_rows). После: fetch_ranking_rows — один запрос с GROUP_CONCAT и RANK().
+
+Запуск: python -m bench.ranking [--users 10000] [--rounds 3]
+"""
+
+import argparse
+import asyncio
+import time
+
+from bench.common import format_summary, generate_db, main, open_pool, temp_db_path
+
+
+async def legacy_ranking_rows() -> list:
+    """Строки рейтинга так, как их собирал export_to_google_sheets до RANKING_SQL."""
+    async with main.db_pool.read() as db:
+        cur = await db.execute("SELECT tg_id, fio, acad_group, points FROM users")
+        rows = []
+        for tg_id, fio, acad_group, points in await cur.fetchall():
+            cur2 = await db.execute("SELECT task_id FROM submissions WHERE user_id=? AND status='accepted'", (tg_id,))
+            tasks = ",".join(str(t[0]) for t in await cur2.fetchall())
+            rows.append([fio, acad_group, points, tasks])
+
+    rows.sort(key=lambda r: r[2], reverse=True)
+    ranked = []
+    rank = 1
+    for i, row in enumerate(rows):
+        if i > 0 and row[2] < rows[i - 1][2]:
+            rank = i + 1
+        ranked.append([rank] + row)
+    return ranked
+
+
+async def measure(build, rounds: int) -> tuple:
+    samples, result = [], None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = await build()
+        samples.append(time.perf_counter() - start)
+    return samples, result
+
+
+async def run(users: int, rounds: int):
+    pool = await open_pool(temp_db_path("ranking.db"))
+    tasks = len(main.TASKS)
+    info = await generate_db(users * tasks, per_user=tasks)
+    print(f"База: {info['users']} участников × {tasks} заданий = {info['submissions']} ответов")
+
+    legacy_samples, legacy = await measure(legacy_ranking_rows, rounds)
+    print(format_summary("до: N+1 запросов", legacy_samples))
+    samples, rows = await measure(main.fetch_ranking_rows, rounds)
+    print(format_summary("после: RANKING_SQL", samples))
+    print(f"Ускорение по медиане: ×{main.percentile(legacy_samples, 50) / main.percentile(samples, 50):.1f}; "
+          f"результаты {'совпадают' if rows == legacy else 'РАЗЛИЧАЮТСЯ'}")
+    await pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.rounds))
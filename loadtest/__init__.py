@@ -0,0 +1,6 @@
+"""
+Нагрузочный прогон бота без Telegram.
+
+fake_api — заглушка Bot API на aiohttp, python -m loadtest — сценарий с синтетическими
+участниками и кураторами и отчётом p50/p95/p99.
+"""
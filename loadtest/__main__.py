@@ -0,0 +1,296 @@
+"""
+Нагрузочный прогон бота против локальной заглушки Bot API.
+
+Синтетические участники регистрируются и отправляют ответы на все задания всех типов
+(текст, фото, видео, фото с текстом, альбом, фото/видео с /done и суперзадание после трёх
+зачётов), кураторы разбирают свои очереди кнопками «Начать проверку», «Зачесть» и «Не зачесть»,
+администратор раз в несколько секунд смотрит /stats. Бот получает обновления через getUpdates
+(или напрямую через dp.feed_update в режиме --mode feed) и ходит в заглушку вместо Telegram.
+
+В конце печатаются p50/p95/p99 по шагам сценария (от отправки обновления до конца его обработки),
+задержки хендлеров из perf_metrics, пропускная способность и число вызовов Bot API.
+Заглушка работает в том же процессе, что и бот, поэтому делит с ним процессор. С --think 0
+участники шлют обновления без пауз, и очередь к писателю БД растёт вместе с их числом —
+так измеряется предельная пропускная способность, а не задержка при обычной нагрузке.
+
+Запуск из корня проекта: python -m loadtest [--users 200] [--curators 10] [--mode polling|feed]
+"""
+
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from loadtest.fake_api import BOT_USER, FakeBotAPI
+
+ADMIN_ID = 1_000_000
+CHECK_TIMEOUT = 60  # секунды на обработку одного обновления, прежде чем сценарий сочтёт его зависшим
+
+
+class LoadTest:
+    def __init__(self, api: FakeBotAPI, bot_module, mode: str, reject_share: float, think: float, seed: int):
+        self.api = api
+        self.bot = bot_module
+        self.mode = mode
+        self.reject_share = reject_share
+        self.think = think
+        self.rnd = random.Random(seed)
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.accepted_seen: Dict[int, int] = defaultdict(int)
+        self.updates = 0
+        self._done: Dict[int, asyncio.Future] = {}
+        self.bot.dp.update.outer_middleware(self._track_done)
+
+    async def _track_done(self, handler, event, data):
+        try:
+            return await handler(event, data)
+        finally:
+            future = self._done.pop(event.update_id, None)
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    # ---- обновления от синтетических пользователей ----
+    def _user(self, user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"Участник {user_id}"}
+
+    def _message(self, user_id: int, **content) -> dict:
+        return {"message": {
+            "message_id": self.api.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            **content,
+        }}
+
+    def _callback(self, user_id: int, data: str) -> dict:
+        return {"callback_query": {
+            "id": str(self.api.next_message_id()),
+            "from": self._user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": self.api.next_message_id(),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": BOT_USER,
+                "text": "…",
+            },
+        }}
+
+    def _photo(self, user_id: int, n: int, **extra) -> dict:
+        file = f"photo_{user_id}_{n}"
+        return self._message(user_id, photo=[{"file_id": file, "file_unique_id": file, "width": 1280,
+                                               "height": 960}], **extra)
+
+    def _video(self, user_id: int, n: int) -> dict:
+        file = f"video_{user_id}_{n}"
+        return self._message(user_id, video={"file_id": file, "file_unique_id": file, "width": 1280,
+                                             "height": 720, "duration": 15})
+
+    async def send(self, step: str, update: dict):
+        """Отдаёт обновление боту и ждёт конца его обработки; задержка пишется под именем шага."""
+        start = time.perf_counter()
+        if self.mode == "polling":
+            update_id = self.api.push_update(update)
+            future = asyncio.get_running_loop().create_future()
+            self._done[update_id] = future
+            await asyncio.wait_for(future, CHECK_TIMEOUT)
+        else:
+            update["update_id"] = self.api.next_update_id()
+            await self.bot.dp.feed_update(
+                self.bot.bot, self.bot.types.Update.model_validate(update, context={"bot": self.bot.bot}))
+        self.latency[step].append(time.perf_counter() - start)
+        self.updates += 1
+
+    async def wait_message(self, chat_id: int, prefix: str, timeout: float) -> bool:
+        """Ждёт сообщение бота в чате, начинающееся с prefix; по пути считает уведомления о зачёте."""
+        inbox = self.api.inbox(chat_id)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                msg = await asyncio.wait_for(inbox.get(), max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                return False
+            if msg["text"].startswith("✅ Ваше задание"):
+                self.accepted_seen[chat_id] += 1
+            if msg["text"].startswith(prefix):
+                return True
+
+    # ---- сценарии ----
+    async def submit(self, user_id: int, task_id: int):
+        kind = self.bot.task_by_id(task_id)["type"]
+        await self.send("task_", self._callback(user_id, f"task_{task_id}"))
+        await self.send("send_", self._callback(user_id, f"send_{task_id}"))
+        step = f"answer:{kind}"
+        if kind == "text":
+            await self.send(step, self._message(user_id, text=f"Ответ участника {user_id} на задание {task_id}"))
+        elif kind == "photo":
+            await self.send(step, self._photo(user_id, task_id))
+        elif kind == "video":
+            await self.send(step, self._video(user_id, task_id))
+        elif kind == "photo_text":
+            await self.send(step, self._photo(user_id, task_id))
+            await self.send(step, self._message(user_id, text="Пояснение к фото"))
+        elif kind == "photo_multi":
+            group = f"album_{user_id}_{task_id}"
+            for n in range(3):
+                await self.send(step, self._photo(user_id, task_id * 10 + n, media_group_id=group))
+            start = time.perf_counter()
+            if await self.wait_message(user_id, "✅ Ваш альбом", CHECK_TIMEOUT):
+                self.latency["album:flush"].append(time.perf_counter() - start)
+        elif kind == "photo_video":
+            await self.send(step, self._photo(user_id, task_id * 10))
+            await self.send(step, self._video(user_id, task_id * 10 + 1))
+            await self.send(step, self._message(user_id, text="/done"))
+
+    async def participant(self, user_id: int, delay: float, super_wait: float):
+        await asyncio.sleep(delay)
+        await self.send("/start", self._message(user_id, text="/start"))
+        await self.send("fio", self._message(user_id, text=f"Участников Участник {user_id}"))
+        await self.send("group", self._message(user_id, text=f"Группа {user_id % 40}"))
+        tasks = [t["id"] for t in self.bot.TASKS if t["id"] != 14]
+        self.rnd.shuffle(tasks)
+        for task_id in tasks:
+            if self.think:
+                await asyncio.sleep(self.rnd.uniform(0, 2 * self.think))
+            await self.submit(user_id, task_id)
+        # суперзадание открывается после трёх зачётов
+        deadline = time.monotonic() + super_wait
+        while self.accepted_seen[user_id] < 3 and time.monotonic() < deadline:
+            await self.wait_message(user_id, "✅ Ваше задание", deadline - time.monotonic())
+        if self.accepted_seen[user_id] >= 3:
+            await self.submit(user_id, 14)
+        await self.send("/profile", self._message(user_id, text="/profile"))
+
+    async def curator(self, curator_tg: int, participants_done: asyncio.Event):
+        inbox = self.api.inbox(curator_tg)
+        reviewing = final_sweep = False
+        decided = set()
+        while True:
+            try:
+                msg = await asyncio.wait_for(inbox.get(), 0.5)
+            except asyncio.TimeoutError:
+                if not participants_done.is_set() or reviewing:
+                    continue
+                if final_sweep:
+                    return
+                # уведомление могло прийти, пока куратор дочитывал очередь — проходим её ещё раз
+                final_sweep = reviewing = True
+                await self.send("curator_start_check", self._callback(curator_tg, "curator_start_check"))
+                continue
+
+            accept = next((b for b in msg["buttons"] if b.startswith("cur_accept_")), None)
+            if accept:
+                submission_id = int(accept.rsplit("_", 1)[1])
+                if submission_id in decided:
+                    continue
+                decided.add(submission_id)
+                reviewing = True
+                if self.rnd.random() < self.reject_share:
+                    await self.send("cur_reject", self._callback(curator_tg, f"cur_reject_{submission_id}"))
+                    await self.send("reject_reason", self._message(curator_tg, text="Не хватает деталей"))
+                else:
+                    await self.send("cur_accept", self._callback(curator_tg, accept))
+            elif msg["text"].startswith("✅ Все задания проверены"):
+                reviewing = False
+            elif "curator_start_check" in msg["buttons"] and not reviewing:
+                reviewing = True
+                await self.send("curator_start_check", self._callback(curator_tg, "curator_start_check"))
+
+    async def admin(self, stop: asyncio.Event, interval: float):
+        while not stop.is_set():
+            await self.send("/stats", self._message(ADMIN_ID, text="/stats"))
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+def load_bot(api_url: str, db_path: str):
+    """Импортирует main уже настроенным на заглушку: бот и пул создаются при импорте."""
+    os.environ.update(TELEGRAM_API_URL=api_url, DB_PATH=db_path, ADMIN_IDS=str(ADMIN_ID))
+    os.environ.setdefault("BOT_TOKEN", "123456:loadtest")
+    return importlib.import_module("main")
+
+
+async def run(args):
+    api = FakeBotAPI(args.api_delay)
+    url = await api.start()
+    db_path = os.path.join(tempfile.mkdtemp(prefix="loadtest_"), "bot.db")
+    bot_module = load_bot(url, db_path)
+    from bench.common import CURATOR_TG_BASE, format_summary
+
+    logging.getLogger().setLevel(logging.WARNING)
+    await bot_module.db_pool.open()
+    await bot_module.init_db()
+    async with bot_module.db_pool.write() as db:
+        await db.executemany("INSERT INTO curators (fio, telegram_id) VALUES (?, ?)",
+                             [(f"Куратор {n}", CURATOR_TG_BASE + n) for n in range(1, args.curators + 1)])
+    bot_module.fsm_storage.start()
+
+    test = LoadTest(api, bot_module, args.mode, args.reject_share, args.think, args.seed)
+    polling = None
+    if args.mode == "polling":
+        polling = asyncio.create_task(bot_module.dp.start_polling(
+            bot_module.bot, handle_signals=False, close_bot_session=False, polling_timeout=1))
+
+    participants_done = asyncio.Event()
+    curators = [asyncio.create_task(test.curator(CURATOR_TG_BASE + n, participants_done))
+                for n in range(1, args.curators + 1)]
+    admin = asyncio.create_task(test.admin(participants_done, args.stats_interval))
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        test.participant(user_id, args.ramp * n / args.users, args.super_wait)
+        for n, user_id in enumerate(range(10_000, 10_000 + args.users))
+    ))
+    participants_done.set()
+    await asyncio.gather(*curators, admin)
+    await test.send("/review_stats", test._message(ADMIN_ID, text="/review_stats"))
+    wall = time.perf_counter() - started
+
+    async with bot_module.db_pool.read() as db:
+        cur = await db.execute("SELECT status, COUNT(*) FROM submissions GROUP BY status ORDER BY status")
+        statuses = dict(await cur.fetchall())
+
+    print(f"\nУчастников: {args.users}, кураторов: {args.curators}, режим: {args.mode}")
+    print(f"Время: {wall:.1f} с, обновлений: {test.updates} ({test.updates / wall:.1f}/с)")
+    print(f"Ответы в базе: {statuses}")
+    print("\nШаги сценария (от отправки обновления до конца обработки):")
+    for step in sorted(test.latency):
+        print(format_summary(step, test.latency[step]))
+    print()
+    print(bot_module.perf_metrics.report_text("handler:"))
+    print("\nВызовы Bot API: " + ", ".join(f"{m}={n}" for m, n in api.calls.most_common()))
+
+    if polling is not None:
+        await bot_module.dp.stop_polling()
+        await polling
+    await bot_module.media_groups.stop()
+    await bot_module.review_prefetcher.stop()
+    await bot_module.fsm_storage.close()
+    await bot_module.db_pool.close()
+    await bot_module.bot.session.close()
+    await api.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон бота против заглушки Bot API")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--curators", type=int, default=10)
+    parser.add_argument("--mode", choices=("polling", "feed"), default="polling")
+    parser.add_argument("--ramp", type=float, default=5.0, help="за сколько секунд подключаются все участники")
+    parser.add_argument("--think", type=float, default=1.0,
+                        help="средняя пауза участника между заданиями, с; 0 — прогон на насыщение")
+    parser.add_argument("--reject-share", type=float, default=0.2, help="доля ответов, которые кураторы отклоняют")
+    parser.add_argument("--super-wait", type=float, default=30.0,
+                        help="сколько участник ждёт трёх зачётов ради суперзадания, с")
+    parser.add_argument("--stats-interval", type=float, default=3.0, help="как часто админ открывает /stats, с")
+    parser.add_argument("--api-delay", type=float, default=0.0, help="задержка ответа заглушки, с")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,159 @@
+"""
+Локальная заглушка Telegram Bot API.
+
+Отвечает на запросы бота так же, как настоящий сервер (формат {"ok": true, "result": ...}):
+getUpdates отдаёт обновления из очереди, sendMessage / sendPhoto / sendVideo / sendMediaGroup
+возвращают сообщения с новыми message_id, editMessage* и прочие методы — true.
+Все отправленные ботом сообщения складываются в очередь чата, откуда их читают сценарии.
+
+Отдельный запуск для ручной проверки: python -m loadtest.fake_api --port 8081,
+затем TELEGRAM_API_URL=http://127.0.0.1:8081 python main.py
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Староста года", "username": "starosta_bot"}
+SEND_METHODS = {"sendmessage", "sendphoto", "sendvideo", "sendmediagroup", "copymessage"}
+
+
+class FakeBotAPI:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay  # искусственная задержка ответа, имитация сети до Telegram
+        self.calls: Counter = Counter()
+        self._updates: List[dict] = []
+        self._new_updates = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._inboxes: Dict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
+        self._runner: Optional[web.AppRunner] = None
+
+    # ---- очередь обновлений ----
+    def push_update(self, update: dict) -> int:
+        """Ставит обновление в очередь getUpdates; update_id назначается здесь."""
+        update["update_id"] = next(self._update_ids)
+        self._updates.append(update)
+        self._new_updates.set()
+        return update["update_id"]
+
+    def next_update_id(self) -> int:
+        return next(self._update_ids)
+
+    def next_message_id(self) -> int:
+        return next(self._message_ids)
+
+    def inbox(self, chat_id: int) -> asyncio.Queue:
+        """Сообщения, отправленные ботом в чат: {"method", "text", "buttons"}."""
+        return self._inboxes[chat_id]
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get("timeout") or 0) or 0.01)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    # ---- ответы на методы ----
+    def _message(self, chat_id: Any, text: Optional[str] = None) -> dict:
+        message = {
+            "message_id": self.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "from": BOT_USER,
+        }
+        if text is not None:
+            message["text"] = text
+        return message
+
+    def _deliver(self, method: str, params: dict):
+        markup = json.loads(params["reply_markup"]) if params.get("reply_markup") else {}
+        buttons = [b.get("callback_data") for row in markup.get("inline_keyboard", []) for b in row]
+        self.inbox(int(params["chat_id"])).put_nowait({
+            "method": method,
+            "text": params.get("text") or params.get("caption") or "",
+            "buttons": [b for b in buttons if b],
+        })
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        if method == "getupdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(params)})
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+        if method == "getme":
+            result: Any = BOT_USER
+        elif method in SEND_METHODS:
+            self._deliver(method, params)
+            if method == "sendmediagroup":
+                result = [self._message(params["chat_id"]) for _ in json.loads(params["media"])]
+            elif method == "copymessage":
+                result = {"message_id": self.next_message_id()}
+            else:
+                result = self._message(params["chat_id"], params.get("text"))
+        elif method in ("editmessagetext", "editmessagereplymarkup") and params.get("chat_id"):
+            result = self._message(params["chat_id"], params.get("text"))
+            result["message_id"] = int(params["message_id"])
+        else:
+            # answerCallbackQuery, deleteWebhook, setMyCommands и прочие служебные методы
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    # ---- сервер ----
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Поднимает сервер и возвращает базовый адрес для TELEGRAM_API_URL."""
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve(port: int, delay: float):
+    api = FakeBotAPI(delay)
+    url = await api.start(port=port)
+    print(f"Заглушка Bot API слушает {url}; Ctrl+C для остановки")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await api.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальная заглушка Telegram Bot API")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--delay", type=float, default=0.0, help="задержка ответа в секундах")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.port, args.delay))
+    except KeyboardInterrupt:
+        pass
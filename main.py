@@ -2,7 +2,7 @@
 Telegram bot для конкурса "Староста года" на aiogram (v3).
 
 Особенности:
-- Назначение куратора из CSV в круговом порядке (round-robin)
+- Назначение куратора: участник получает наименее загруженного куратора (ASSIGN_CURATOR_SQL, одним UPDATE)
 - 13 заданий; 13-е доступно только после зачёта >=3 заданий
 - При отправке решения: проверка типа (photo/video/text), отправка куратору
 - Куратор может принять/отклонить — пользователю приходит уведомление и начисляются баллы
@@ -25,27 +25,42 @@ Telegram bot для конкурса "Староста года" на aiogram (v
 """
 
 import asyncio
+import functools
 import os
-from datetime import datetime
-from typing import List, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Set, Tuple
 import logging
 import json
+import signal
 
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import BotCommand
 from aiogram import F
 import aiosqlite
+from cachetools import TTLCache
 from dotenv import load_dotenv
 import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from aiogram.exceptions import TelegramBadRequest
+from google.auth.transport.requests import Request as GoogleAuthRequest
+from google.oauth2 import service_account
+from gspread.utils import rowcol_to_a1
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
 import secrets
+import threading
+import time
 import zipfile
 
 logging.basicConfig(level=logging.INFO)
@@ -56,13 +71,48 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_IDS = list(map(int, os.getenv("ADMIN_IDS", "").split(","))) if os.getenv("ADMIN_IDS") else []
 CURATORS_CSV = os.getenv("CURATORS_CSV", "curators.csv")
 DB_PATH = os.getenv("DB_PATH", "bot.db")
+DB_READERS = int(os.getenv("DB_READERS", "4"))  # количество читающих соединений в пуле
+USER_STATE_CACHE_SIZE = int(os.getenv("USER_STATE_CACHE_SIZE", "10000"))
+USER_STATE_CACHE_TTL = int(os.getenv("USER_STATE_CACHE_TTL", "300"))  # секунды
 SPREADSHEET_ID = os.getenv('SPREADSHEET_ID')
 SPREADSHEET_NAME = "Староста года"  # название таблицы
 SHEET_NAME = "Рейтинг"  # лист для рейтинга
+EXPORT_COALESCE_SECONDS = float(os.getenv("EXPORT_COALESCE_SECONDS", "5"))  # окно схлопывания автоэкспортов
+GS_CREDENTIALS_FILE = "credentials.json"
+GS_SCOPES = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+]
+GS_TOKEN_REFRESH_MARGIN = timedelta(minutes=5)  # обновляем токен заранее, до истечения
+EXPORT_FULL_REWRITE_RATIO = 0.5  # если изменилось больше этой доли строк — переписываем лист целиком
 TASKS_JSON_PATH = "tasks_data.json"
 BACKUP_DIR = "backups"
 BACKUP_INTERVAL_HOURS = 24
+DEDUP_INTERVAL = int(os.getenv("DEDUP_INTERVAL", "300"))  # секунды между чистками дубликатов ответов
 LOG_FILE = "all_logs.txt"
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # сообщений в секунду (общий лимит Telegram ~30)
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+BROADCAST_CHUNK_SIZE = 100  # после каждой пачки прогресс сохраняется в базу
+BROADCAST_PROGRESS_INTERVAL = 3.0  # секунды между обновлениями сообщения с прогрессом
+BROADCAST_MAX_RETRIES = 3
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", str(48 * 3600)))  # через сколько секунд брошенное состояние удаляется
+FSM_FLUSH_INTERVAL = 0.5  # секунды между пакетными записями состояний в базу
+FSM_CACHE_SIZE = 10000
+FSM_SWEEP_INTERVAL = 600  # секунды между чистками устаревших состояний
+# Webhook-режим включается, если задан WEBHOOK_URL; иначе бот работает через long polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))  # секунды на завершение начатых обработчиков
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # свой Bot API сервер или заглушка для нагрузочных тестов
+ALBUM_FLUSH_DELAY = 1.5  # секунды тишины после последней части альбома, прежде чем он считается полным
+BATCH_REVIEW_SIZE = int(os.getenv("BATCH_REVIEW_SIZE", "10"))  # текстовых ответов на одной странице пакетной проверки
+REVIEW_PREFETCH = int(os.getenv("REVIEW_PREFETCH", "3"))  # сколько следующих ответов готовить куратору заранее
+CLAIM_LEASE_MINUTES = int(os.getenv("CLAIM_LEASE_MINUTES", "30"))  # сколько ответ закреплён за куратором без решения
+PERF_WINDOW = int(os.getenv("PERF_WINDOW", "5000"))  # сколько последних замеров задержки хранить на каждый ключ
 
 if not os.path.exists(TASKS_JSON_PATH):
     raise FileNotFoundError(f"Файл {TASKS_JSON_PATH} не найден")
@@ -73,8 +123,255 @@ with open(TASKS_JSON_PATH, "r", encoding="utf-8") as f:
 if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN не установлен в переменных окружения")
 
-bot = Bot(BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+
+
+# ---- FSM-хранилище ----
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище в SQLite (таблица fsm_states) вместо MemoryStorage.
+
+    Незавершённые регистрации и сборы ответов переживают перезапуск бота. Изменения копятся
+    в памяти и раз в FSM_FLUSH_INTERVAL секунд записываются в базу одной транзакцией; чтения
+    обслуживаются из буфера и LRU-кэша. Состояния, не менявшиеся дольше FSM_STATE_TTL,
+    считаются брошенными и удаляются.
+    """
+
+    def __init__(self, ttl: int, flush_interval: float, cache_size: int):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        # ключ -> (state, data в JSON); данные храним сериализованными, чтобы хендлеры не меняли их по ссылке
+        self._cache: TTLCache = TTLCache(maxsize=cache_size, ttl=ttl)
+        self._dirty: Dict[str, Tuple[Optional[str], str, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._last_sweep = 0.0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _load(self, key: StorageKey) -> Tuple[Optional[str], str]:
+        k = self._key_builder.build(key)
+        if k in self._dirty:
+            state, data, _ = self._dirty[k]
+            return state, data
+        entry = self._cache.get(k)
+        if entry is not None:
+            return entry
+
+        async with db_pool.read() as db:
+            cur = await db.execute("SELECT state, data FROM fsm_states WHERE key=? AND updated_at>=?",
+                                   (k, time.time() - self.ttl))
+            row = await cur.fetchone()
+        # пока шёл запрос, ключ могли записать — свежая запись важнее прочитанной
+        if k in self._dirty or k in self._cache:
+            return await self._load(key)
+        entry = (row[0], row[1]) if row else (None, "{}")
+        self._cache[k] = entry
+        return entry
+
+    def _put(self, key: StorageKey, state: Optional[str], data: str):
+        k = self._key_builder.build(key)
+        self._cache[k] = (state, data)
+        self._dirty[k] = (state, data, time.time())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        _, data = await self._load(key)
+        self._put(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._load(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        state, _ = await self._load(key)
+        self._put(key, state, json.dumps(dict(data), ensure_ascii=False))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return json.loads((await self._load(key))[1])
+
+    async def flush(self):
+        """Записывает накопленные изменения одной транзакцией; пустые состояния удаляются."""
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        upserts = [(k, state, data, ts) for k, (state, data, ts) in batch.items() if state is not None or data != "{}"]
+        deletes = [(k,) for k, (state, data, _) in batch.items() if state is None and data == "{}"]
+        try:
+            async with db_pool.write() as db:
+                if upserts:
+                    await db.executemany(
+                        "INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?,?,?,?) "
+                        "ON CONFLICT(key) DO UPDATE SET state=excluded.state, data=excluded.data, "
+                        "updated_at=excluded.updated_at",
+                        upserts)
+                if deletes:
+                    await db.executemany("DELETE FROM fsm_states WHERE key=?", deletes)
+        except Exception:
+            # возвращаем несохранённое в буфер, не затирая более свежие изменения
+            for k, value in batch.items():
+                self._dirty.setdefault(k, value)
+            raise
+
+    async def sweep(self):
+        async with db_pool.write() as db:
+            cur = await db.execute("DELETE FROM fsm_states WHERE updated_at < ?", (time.time() - self.ttl,))
+        if cur.rowcount:
+            logging.info(f"🧹 Удалено устаревших FSM-состояний: {cur.rowcount}")
+        self._last_sweep = time.time()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.time() - self._last_sweep >= FSM_SWEEP_INTERVAL:
+                    await self.sweep()
+            except Exception:
+                logging.exception("❌ Не удалось сохранить FSM-состояния")
+
+
+fsm_storage = SQLiteStorage(FSM_STATE_TTL, FSM_FLUSH_INTERVAL, FSM_CACHE_SIZE)
+
+if TELEGRAM_API_URL:
+    bot = Bot(BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)))
+else:
+    bot = Bot(BOT_TOKEN)
+dp = Dispatcher(storage=fsm_storage)
+
+
+# ===== метрики производительности =====
+def percentile(values, p: float) -> float:
+    """Перцентиль p (0–100) с линейной интерполяцией между соседними значениями."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    pos = (len(ordered) - 1) * p / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+class PerfMetrics:
+    """
+    Задержки обработки по ключам (тип обновления и т.п.).
+
+    На каждый ключ хранится скользящее окно последних замеров для перцентилей
+    и полные счётчики для пропускной способности с момента запуска или сброса.
+    """
+
+    def __init__(self, window: int):
+        self._window = window
+        self._samples: Dict[str, deque] = {}
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self.started = time.monotonic()
+
+    def record(self, key: str, seconds: float, failed: bool = False):
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self._window)
+        samples.append(seconds)
+        self._counts[key] = self._counts.get(key, 0) + 1
+        if failed:
+            self._errors[key] = self._errors.get(key, 0) + 1
+
+    def reset(self):
+        self._samples.clear()
+        self._counts.clear()
+        self._errors.clear()
+        self.started = time.monotonic()
+
+    def summary(self, key: str) -> dict:
+        samples = self._samples.get(key, ())
+        return {
+            "count": self._counts.get(key, 0),
+            "errors": self._errors.get(key, 0),
+            "p50": percentile(samples, 50),
+            "p95": percentile(samples, 95),
+            "p99": percentile(samples, 99),
+            "max": max(samples, default=0.0),
+        }
+
+    def report_text(self, prefix: str = "") -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        keys = sorted((k for k in self._counts if k.startswith(prefix)), key=lambda k: -self._counts[k])
+        total = sum(self._counts[k] for k in keys)
+        lines = [f"⏱ Задержки обработки за {elapsed:.0f} с", f"Всего: {total} ({total / elapsed:.1f}/с)", ""]
+        for key in keys:
+            st = self.summary(key)
+            lines.append(
+                f"{key}: n={st['count']}, p50={st['p50'] * 1000:.1f} мс, p95={st['p95'] * 1000:.1f} мс, "
+                f"p99={st['p99'] * 1000:.1f} мс, max={st['max'] * 1000:.1f} мс"
+                + (f", ошибок={st['errors']}" if st["errors"] else "")
+            )
+        if not keys:
+            lines.append("Замеров пока нет")
+        return "\n".join(lines)
+
+
+perf_metrics = PerfMetrics(PERF_WINDOW)
+
+
+@dp.update.outer_middleware()
+async def measure_update_latency(handler, event: types.Update, data: Dict[str, Any]):
+    start = time.perf_counter()
+    failed = False
+    try:
+        return await handler(event, data)
+    except Exception:
+        failed = True
+        raise
+    finally:
+        try:
+            kind = event.event_type
+        except Exception:
+            kind = "unknown"
+        perf_metrics.record(f"update:{kind}", time.perf_counter() - start, failed)
+
+
+async def measure_handler_latency(handler, event: types.TelegramObject, data: Dict[str, Any]):
+    start = time.perf_counter()
+    failed = False
+    try:
+        return await handler(event, data)
+    except Exception:
+        failed = True
+        raise
+    finally:
+        name = data["handler"].callback.__name__
+        perf_metrics.record(f"handler:{name}", time.perf_counter() - start, failed)
+
+
+dp.message.middleware(measure_handler_latency)
+dp.callback_query.middleware(measure_handler_latency)
+
+
+def timed(key: str):
+    """Замеряет корутину на горячем пути (не хендлер) и пишет в perf_metrics под ключом fn:<key>."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            failed = False
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                perf_metrics.record(f"fn:{key}", time.perf_counter() - start, failed)
+        return wrapper
+    return decorator
 
 # ---- Конфигурация заданий (соответствует документу пользователя) ----
 TASKS = [
@@ -121,6 +418,10 @@ async def create_backup() -> str:
         if isinstance(handler, logging.FileHandler):
             handler.flush()
 
+    # Переносим содержимое WAL-журнала в основной файл базы, чтобы бэкап был полным
+    async with db_pool.write() as db:
+        await db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_name = f"backup_{timestamp}.zip"
     backup_path = os.path.join(BACKUP_DIR, backup_name)
@@ -162,6 +463,38 @@ async def send_backup_to_admin():
             logging.warning(f"⚠️ Не удалось удалить бэкап: {e}")
 
 
+DEDUP_SQL = """
+    UPDATE submissions SET status='duplicate', updated_at=?, claimed_by=NULL, claim_expires_at=NULL
+    WHERE status='pending' AND EXISTS (
+        SELECT 1 FROM submissions a
+        WHERE a.user_id = submissions.user_id AND a.task_id = submissions.task_id AND a.status = 'accepted'
+    )
+    RETURNING user_id
+"""
+
+
+async def dedup_submissions() -> int:
+    """Одним запросом помечает duplicate все ожидающие ответы на уже зачтённые задания."""
+    async with db_pool.write() as db:
+        cur = await db.execute(DEDUP_SQL, (datetime.utcnow().isoformat(),))
+        user_ids = {row[0] for row in await cur.fetchall()}
+    if user_ids:
+        user_state_cache.invalidate(*user_ids)
+    return len(user_ids)
+
+
+async def dedup_scheduler():
+    """Фоновая задача: чистит дубликаты каждые DEDUP_INTERVAL секунд."""
+    while True:
+        try:
+            affected = await dedup_submissions()
+            if affected:
+                logging.info(f"🧹 Помечены дубликаты ответов у {affected} участников")
+        except Exception as e:
+            logging.error(f"Ошибка при чистке дубликатов: {e}")
+        await asyncio.sleep(DEDUP_INTERVAL)
+
+
 async def backup_scheduler():
     """Фоновая задача: создаёт и отправляет бэкапы каждые BACKUP_INTERVAL_HOURS."""
     while True:
@@ -198,16 +531,14 @@ async def cmd_logs(message: types.Message):
                 logging.warning(f"⚠️ Не удалось удалить бэкап: {e}")
 
 
-async def tasks_keyboard_for_user(user_id: int) -> InlineKeyboardMarkup:
+@timed("tasks_keyboard")
+async def tasks_keyboard_for_user(user_id: int, user_state: Optional["UserTaskState"] = None) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Получаем id задач, которые уже выполнены или на проверке
-        cur = await db.execute(
-            "SELECT task_id, status FROM submissions WHERE user_id=? AND status IN ('pending', 'accepted')",
-            (user_id,)
-        )
-        done_or_pending = [r[0] for r in await cur.fetchall()]
+    # id задач, которые уже выполнены или на проверке
+    if user_state is None:
+        user_state = await load_user_task_state(user_id)
+    done_or_pending = user_state.accepted | user_state.pending
 
     # Формируем кнопки только для доступных заданий
     for t in TASKS:
@@ -241,8 +572,217 @@ class AnswerFSM(StatesGroup):
 
 
 # ---- Database helpers ----
+class DBPool:
+    """
+    Пул долгоживущих соединений с SQLite.
+
+    Несколько соединений для чтения и одно соединение для записи, доступ к которому
+    сериализуется через lock. База работает в режиме WAL, поэтому читатели не
+    блокируются писателем. Соединения открываются в on_startup и закрываются при остановке.
+    """
+
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA busy_timeout=5000",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-16000",
+    )
+
+    def __init__(self, path: str, readers: int = 4):
+        self.path = path
+        self.readers_count = max(1, readers)
+        self._readers: Optional[asyncio.Queue] = None
+        self._all_readers: List[aiosqlite.Connection] = []
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+
+    async def _connect(self) -> aiosqlite.Connection:
+        db = await aiosqlite.connect(self.path)
+        for pragma in self.PRAGMAS:
+            await db.execute(pragma)
+        return db
+
+    async def open(self):
+        if self._writer is not None:
+            return
+        # писатель открывается первым — он переводит базу в WAL
+        self._writer = await self._connect()
+        self._readers = asyncio.Queue()
+        for _ in range(self.readers_count):
+            conn = await self._connect()
+            self._all_readers.append(conn)
+            self._readers.put_nowait(conn)
+        logging.info(f"🗄 Пул БД открыт: {self.readers_count} читателей + 1 писатель ({self.path})")
+
+    async def close(self):
+        if self._writer is None:
+            return
+        async with self._write_lock:
+            for conn in self._all_readers:
+                await conn.close()
+            await self._writer.close()
+            self._all_readers = []
+            self._readers = None
+            self._writer = None
+        logging.info("🗄 Пул БД закрыт")
+
+    @asynccontextmanager
+    async def read(self):
+        """Соединение только для чтения. Нельзя вкладывать read() в read() — пул может исчерпаться."""
+        db = await self._readers.get()
+        try:
+            yield db
+        finally:
+            self._readers.put_nowait(db)
+
+    @asynccontextmanager
+    async def write(self):
+        """Эксклюзивное соединение для записи. Транзакция фиксируется при выходе, при ошибке — откатывается."""
+        async with self._write_lock:
+            db = self._writer
+            try:
+                yield db
+            except BaseException:
+                await db.rollback()
+                raise
+            if db.in_transaction:
+                await db.commit()
+
+
+db_pool = DBPool(DB_PATH, DB_READERS)
+
+
+@dataclass
+class UserTaskState:
+    """Всё, что нужно для проверок при выборе и отправке задания, — собирается одним запросом."""
+    user_id: int
+    registered: bool = False
+    fio: Optional[str] = None
+    curator_idx: Optional[int] = None
+    curator_tg: Optional[int] = None
+    points: int = 0
+    accepted: Set[int] = field(default_factory=set)
+    pending: Set[int] = field(default_factory=set)
+    submissions_closed: bool = False
+
+    @property
+    def accepted_count(self) -> int:
+        return len(self.accepted)
+
+    def task_block_reason(self, task_id: int) -> Optional[str]:
+        """Текст отказа, если задание сейчас нельзя выбрать или отправить, иначе None."""
+        if task_id in self.accepted:
+            return "Вы уже выполнили это задание и оно зачтено."
+        if task_id in self.pending:
+            return "У вас уже есть решение этого задания на проверке."
+        if task_id == 14 and self.accepted_count < 3:
+            return "Супер-задание доступно только после выполнения как минимум 3 заданий."
+        return None
+
+
+USER_TASK_STATE_SQL = """
+    SELECT u.tg_id, u.fio, u.curator_idx, c.telegram_id, u.points,
+           (SELECT value FROM meta WHERE key='submissions_closed'),
+           s.task_id, s.status
+    FROM (SELECT ? AS id) q
+    LEFT JOIN users u ON u.tg_id = q.id
+    LEFT JOIN curators c ON c.idx = u.curator_idx
+    LEFT JOIN submissions s ON s.user_id = q.id AND s.status IN ('pending', 'accepted')
+"""
+
+
+class UserStateCache:
+    """
+    LRU/TTL-кэш UserTaskState в памяти процесса.
+
+    Записи сбрасываются на путях записи (новый ответ, проверка, удаление) сразу после commit.
+    Счётчик версий не даёт положить в кэш состояние, прочитанное до сброса.
+    """
+
+    def __init__(self, maxsize: int, ttl: int):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int) -> Optional[UserTaskState]:
+        state = self._cache.get(user_id)
+        if state is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return state
+
+    def put(self, user_id: int, state: UserTaskState, version: int):
+        if version == self._version:
+            self._cache[user_id] = state
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def invalidate(self, *user_ids: int):
+        self._version += 1
+        self.invalidations += 1
+        for user_id in user_ids:
+            self._cache.pop(user_id, None)
+
+    def clear(self):
+        self._version += 1
+        self.invalidations += 1
+        self._cache.clear()
+
+    def stats_text(self) -> str:
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0.0
+        return (
+            f"🧠 Кэш состояний участников\n\n"
+            f"Записей: {len(self._cache)}/{self._cache.maxsize} (TTL {int(self._cache.ttl)} с)\n"
+            f"✅ Попаданий: {self.hits}\n"
+            f"❌ Промахов: {self.misses}\n"
+            f"📈 Hit rate: {hit_rate:.1f}%\n"
+            f"🧹 Сбросов: {self.invalidations}"
+        )
+
+
+user_state_cache = UserStateCache(USER_STATE_CACHE_SIZE, USER_STATE_CACHE_TTL)
+
+
+async def load_user_task_state(user_id: int) -> UserTaskState:
+    state = user_state_cache.get(user_id)
+    if state is not None:
+        return state
+    version = user_state_cache.version
+    state = await fetch_user_task_state(user_id)
+    user_state_cache.put(user_id, state, version)
+    return state
+
+
+@timed("fetch_user_task_state")
+async def fetch_user_task_state(user_id: int) -> UserTaskState:
+    async with db_pool.read() as db:
+        cur = await db.execute(USER_TASK_STATE_SQL, (user_id,))
+        rows = await cur.fetchall()
+
+    state = UserTaskState(user_id=user_id)
+    for tg_id, fio, curator_idx, curator_tg, points, closed, task_id, status in rows:
+        state.registered = tg_id is not None
+        state.fio = fio
+        state.curator_idx = curator_idx
+        state.curator_tg = curator_tg
+        state.points = points or 0
+        state.submissions_closed = closed == "true"
+        if status == "accepted":
+            state.accepted.add(task_id)
+        elif status == "pending":
+            state.pending.add(task_id)
+    return state
+
+
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with db_pool.write() as db:
         await db.execute("""
         CREATE TABLE IF NOT EXISTS curators (
             idx INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -274,75 +814,315 @@ async def init_db():
             created_at TEXT,
             updated_at TEXT
         )""")
-        await db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_curator_idx', '1')")
         await db.commit()
+        await run_migrations(db)
+        # на писателе: читатели, открытые до миграций, могут ещё видеть старую схему
+        await check_hot_query_plans(db)
+
+
+def parse_legacy_content(content_type: str, content: str) -> Tuple[Optional[str], List[Tuple[str, str]]]:
+    """Разбирает старый формат content ('photo:<id>|text:<текст>' и т.п.) в (текст, [(вид, file_id)])."""
+    if content_type == "photo":
+        return None, [("photo", content)]
+    if content_type == "video":
+        return None, [("video", content)]
+    if content_type == "photo_text":
+        # текст идёт последним и сам может содержать '|'
+        head, _, rest = content.partition("|")
+        return rest.partition(":")[2], [("photo", head.partition(":")[2])]
+    if content_type in ("photo_multi", "photo_video"):
+        media = []
+        for part in content.split("|"):
+            kind, _, file_id = part.partition(":")
+            if kind in ("photo", "video") and file_id:
+                media.append((kind, file_id))
+        return None, media
+    return content, []
+
+
+async def migrate_submission_content(db: aiosqlite.Connection):
+    cur = await db.execute("SELECT id, content_type, content FROM submissions WHERE content IS NOT NULL")
+    texts, media = [], []
+    for submission_id, content_type, content in await cur.fetchall():
+        text, parts = parse_legacy_content(content_type, content)
+        texts.append((text, submission_id))
+        media.extend((submission_id, n, kind, file_id) for n, (kind, file_id) in enumerate(parts))
+    await db.executemany("UPDATE submissions SET text=? WHERE id=?", texts)
+    await db.executemany(
+        "INSERT INTO submission_media (submission_id, ordinal, kind, file_id) VALUES (?,?,?,?)", media)
+    logging.info(f"🛠 Перенесено ответов: {len(texts)}, медиафайлов: {len(media)}")
+
+
+# Счётчики и запросы, которые пересчитывают их с нуля и исправляют расхождения.
+# Обычно счётчики ведут триггеры миграции 8 в той же транзакции, что меняет статус ответа.
+USER_ACCEPTED_SQL = "SELECT COUNT(*) FROM submissions s WHERE s.user_id = users.tg_id AND s.status = 'accepted'"
+USER_PENDING_SQL = "SELECT COUNT(*) FROM submissions s WHERE s.user_id = users.tg_id AND s.status = 'pending'"
+CURATOR_PENDING_SQL = (
+    "SELECT COUNT(*) FROM submissions s JOIN users u ON u.tg_id = s.user_id "
+    "WHERE u.curator_idx = curators.idx AND s.status = 'pending'"
+)
+CURATOR_USERS_SQL = "SELECT COUNT(*) FROM users WHERE curator_idx = curators.idx"
+COUNTER_REPAIRS = {
+    "users.accepted_count":
+        f"UPDATE users SET accepted_count = ({USER_ACCEPTED_SQL}) WHERE accepted_count IS NOT ({USER_ACCEPTED_SQL})",
+    "users.pending_count":
+        f"UPDATE users SET pending_count = ({USER_PENDING_SQL}) WHERE pending_count IS NOT ({USER_PENDING_SQL})",
+    "curators.pending_count":
+        f"UPDATE curators SET pending_count = ({CURATOR_PENDING_SQL}) "
+        f"WHERE pending_count IS NOT ({CURATOR_PENDING_SQL})",
+    "curators.users_count":
+        f"UPDATE curators SET users_count = ({CURATOR_USERS_SQL}) WHERE users_count IS NOT ({CURATOR_USERS_SQL})",
+}
+
+
+# ---- Миграции схемы ----
+# Каждая миграция: (версия, описание, шаги). Шаг — SQL-строка или async-функция от соединения (для переноса данных).
+# Номер последней применённой хранится в meta.schema_version.
+# Новые миграции только добавляются в конец списка, уже выпущенные не редактируются.
+MIGRATIONS = [
+    (1, "индексы для горячих запросов", [
+        "CREATE INDEX IF NOT EXISTS idx_submissions_user_task_status ON submissions (user_id, task_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_submissions_status_created ON submissions (status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_users_curator ON users (curator_idx)",
+        "CREATE INDEX IF NOT EXISTS idx_curators_telegram ON curators (telegram_id)",
+    ]),
+    (2, "очередь рассылок", [
+        """CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            created_by INTEGER,
+            chat_id INTEGER,
+            message_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'queued',
+            cursor INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            delivered INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT,
+            started_at TEXT,
+            finished_at TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs (status, id)",
+        # незавершённая рассылка из старого формата (JSON в meta) переносится в очередь
+        """INSERT INTO broadcast_jobs (text, chat_id, message_id, status, cursor, total, delivered, failed, blocked)
+           SELECT json_extract(value, '$.text'), json_extract(value, '$.chat_id'),
+                  json_extract(value, '$.message_id'), 'running', json_extract(value, '$.cursor'),
+                  json_extract(value, '$.total'), json_extract(value, '$.delivered'),
+                  json_extract(value, '$.failed'), json_extract(value, '$.blocked')
+           FROM meta WHERE key='broadcast_job'""",
+        "DELETE FROM meta WHERE key='broadcast_job'",
+    ]),
+    (3, "FSM-состояния в базе", [
+        """CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_at REAL NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states (updated_at)",
+    ]),
+    (4, "захват ответов кураторами", [
+        "ALTER TABLE submissions ADD COLUMN claimed_by INTEGER",
+        "ALTER TABLE submissions ADD COLUMN claim_expires_at TEXT",
+    ]),
+    (5, "не больше одного зачтённого ответа на задание", [
+        # из нескольких зачтённых вариантов остаётся самый ранний, остальные — duplicate
+        """UPDATE submissions SET status='duplicate'
+           WHERE status='accepted' AND id NOT IN (
+               SELECT MIN(id) FROM submissions WHERE status='accepted' GROUP BY user_id, task_id
+           )""",
+        """CREATE UNIQUE INDEX IF NOT EXISTS idx_submissions_accepted_once
+           ON submissions (user_id, task_id) WHERE status='accepted'""",
+    ]),
+    (6, "счётчик участников у кураторов", [
+        "ALTER TABLE curators ADD COLUMN users_count INTEGER NOT NULL DEFAULT 0",
+        "UPDATE curators SET users_count = (SELECT COUNT(*) FROM users WHERE curator_idx = curators.idx)",
+        "CREATE INDEX IF NOT EXISTS idx_curators_load ON curators (users_count, idx)",
+        # круговая очередь по next_curator_idx больше не используется
+        "DELETE FROM meta WHERE key='next_curator_idx'",
+    ]),
+    (7, "медиа ответов в отдельной таблице", [
+        """CREATE TABLE IF NOT EXISTS submission_media (
+            submission_id INTEGER NOT NULL,
+            ordinal INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            file_unique_id TEXT,
+            PRIMARY KEY (submission_id, ordinal)
+        ) WITHOUT ROWID""",
+        "ALTER TABLE submissions ADD COLUMN text TEXT",
+        migrate_submission_content,
+        "ALTER TABLE submissions DROP COLUMN content",
+    ]),
+    (8, "счётчики ответов, которые ведут триггеры", [
+        "ALTER TABLE users ADD COLUMN accepted_count INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN pending_count INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE curators ADD COLUMN pending_count INTEGER NOT NULL DEFAULT 0",
+        """CREATE TRIGGER IF NOT EXISTS trg_submissions_insert AFTER INSERT ON submissions
+        BEGIN
+            UPDATE users SET pending_count = pending_count + (NEW.status = 'pending'),
+                             accepted_count = accepted_count + (NEW.status = 'accepted')
+            WHERE tg_id = NEW.user_id;
+            UPDATE curators SET pending_count = pending_count + 1
+            WHERE NEW.status = 'pending' AND idx = (SELECT curator_idx FROM users WHERE tg_id = NEW.user_id);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_submissions_delete AFTER DELETE ON submissions
+        BEGIN
+            UPDATE users SET pending_count = pending_count - (OLD.status = 'pending'),
+                             accepted_count = accepted_count - (OLD.status = 'accepted')
+            WHERE tg_id = OLD.user_id;
+            UPDATE curators SET pending_count = pending_count - 1
+            WHERE OLD.status = 'pending' AND idx = (SELECT curator_idx FROM users WHERE tg_id = OLD.user_id);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_submissions_status AFTER UPDATE OF status, user_id ON submissions
+        WHEN OLD.status IS NOT NEW.status OR OLD.user_id IS NOT NEW.user_id
+        BEGIN
+            UPDATE users SET pending_count = pending_count - (OLD.status = 'pending'),
+                             accepted_count = accepted_count - (OLD.status = 'accepted')
+            WHERE tg_id = OLD.user_id;
+            UPDATE curators SET pending_count = pending_count - 1
+            WHERE OLD.status = 'pending' AND idx = (SELECT curator_idx FROM users WHERE tg_id = OLD.user_id);
+            UPDATE users SET pending_count = pending_count + (NEW.status = 'pending'),
+                             accepted_count = accepted_count + (NEW.status = 'accepted')
+            WHERE tg_id = NEW.user_id;
+            UPDATE curators SET pending_count = pending_count + 1
+            WHERE NEW.status = 'pending' AND idx = (SELECT curator_idx FROM users WHERE tg_id = NEW.user_id);
+        END""",
+        # при смене куратора его ожидающие ответы переезжают вместе с участником
+        """CREATE TRIGGER IF NOT EXISTS trg_users_curator AFTER UPDATE OF curator_idx ON users
+        WHEN OLD.curator_idx IS NOT NEW.curator_idx AND NEW.pending_count != 0
+        BEGIN
+            UPDATE curators SET pending_count = pending_count - NEW.pending_count WHERE idx = OLD.curator_idx;
+            UPDATE curators SET pending_count = pending_count + NEW.pending_count WHERE idx = NEW.curator_idx;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_users_delete AFTER DELETE ON users
+        WHEN OLD.pending_count != 0
+        BEGIN
+            UPDATE curators SET pending_count = pending_count - OLD.pending_count WHERE idx = OLD.curator_idx;
+        END""",
+        *COUNTER_REPAIRS.values(),
+    ]),
+    (9, "метки времени показа и решения", [
+        "ALTER TABLE submissions ADD COLUMN shown_at TEXT",
+        "ALTER TABLE submissions ADD COLUMN decided_at TEXT",
+        # для уже проверенных ответов время решения — последнее изменение, время показа неизвестно
+        "UPDATE submissions SET decided_at = updated_at WHERE status IN ('accepted', 'rejected')",
+        "CREATE INDEX IF NOT EXISTS idx_submissions_decided ON submissions (decided_at) WHERE decided_at IS NOT NULL",
+    ]),
+]
 
 
-async def update_google_sheet():
-    # подключаемся к Google Sheets
-    scope = [
-        "https://spreadsheets.google.com/feeds",
-        "https://www.googleapis.com/auth/drive"
-    ]
-    creds = ServiceAccountCredentials.from_json_keyfile_name("credentials.json", scope)
-    client = gspread.authorize(creds)
-
-    spreadsheet = client.open_by_key(SPREADSHEET_ID)
-    sheet = spreadsheet.sheet1
+async def get_schema_version(db: aiosqlite.Connection) -> int:
+    cur = await db.execute("SELECT value FROM meta WHERE key='schema_version'")
+    row = await cur.fetchone()
+    return int(row[0]) if row else 0
 
-    # собираем данные из базы
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT tg_id, fio, acad_group, points FROM users")
-        users = await cur.fetchall()
-        rows = []
-        for u in users:
-            tg_id, fio, acad_group, points = u
-            cur2 = await db.execute(
-                "SELECT task_id FROM submissions WHERE user_id=? AND status='accepted'",
-                (tg_id,)
-            )
-            tasks = await cur2.fetchall()
-            task_list = ",".join(str(t[0]) for t in tasks)
-            rows.append([fio, acad_group, points, task_list])
 
-    # формируем таблицу
-    headers = ["ФИО", "Группа", "Баллы", "Выполненные задания"]
-    data = [headers] + rows
+async def run_migrations(db: aiosqlite.Connection):
+    """Применяет недостающие миграции по порядку, каждую — в отдельной транзакции."""
+    version = await get_schema_version(db)
+    for target, description, statements in MIGRATIONS:
+        if target <= version:
+            continue
+        await db.execute("BEGIN")
+        try:
+            for step in statements:
+                if callable(step):
+                    await step(db)
+                else:
+                    await db.execute(step)
+            await db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)", (str(target),))
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            logging.exception(f"❌ Миграция {target} ({description}) не применена")
+            raise
+        version = target
+        logging.info(f"🛠 Применена миграция {target}: {description}")
+
+
+# Ответ свободен для куратора, если он ничей, уже его или аренда истекла.
+# Параметры: telegram_id куратора, текущее время (ISO).
+CLAIM_CONDITION = "(claimed_by IS NULL OR claimed_by = ? OR claim_expires_at < ?)"
+
+# Одним UPDATE находит самый старый доступный ответ из очереди куратора и закрепляет его.
+# Ответы на уже зачтённые задания пропускаются — их помечает duplicate фоновая чистка.
+# shown_at ставится только при первом показе: повторная выдача после истёкшего закрепления его не сдвигает.
+# Параметры: claimed_by, claim_expires_at, shown_at, telegram_id куратора, затем он же и текущее время (CLAIM_CONDITION).
+CLAIM_NEXT_SQL = """
+    UPDATE submissions SET claimed_by = ?, claim_expires_at = ?, shown_at = COALESCE(shown_at, ?)
+    WHERE id = (
+        SELECT s.id
+        FROM submissions s
+        JOIN users u ON u.tg_id = s.user_id
+        WHERE s.status='pending'
+          AND u.curator_idx=(SELECT idx FROM curators WHERE telegram_id=?)
+          AND (s.claimed_by IS NULL OR s.claimed_by = ? OR s.claim_expires_at < ?)
+          AND NOT EXISTS (
+              SELECT 1 FROM submissions a
+              WHERE a.user_id = s.user_id AND a.task_id = s.task_id AND a.status = 'accepted'
+          )
+        ORDER BY s.created_at ASC
+        LIMIT 1
+    )
+    RETURNING id, user_id, task_id, content_type, text
+"""
 
-    # очищаем и обновляем
-    sheet.clear()
-    sheet.update("A1", data)
+# Наименее загруженный куратор (при равенстве — с меньшим idx) сразу получает +1 участника.
+# Выбор идёт по индексу idx_curators_load, а UPDATE выполняется под единственным писателем,
+# поэтому одновременные регистрации не получают устаревший выбор.
+ASSIGN_CURATOR_SQL = """
+    UPDATE curators SET users_count = users_count + 1
+    WHERE idx = (SELECT idx FROM curators ORDER BY users_count, idx LIMIT 1)
+    RETURNING idx, fio, telegram_id
+"""
 
 
-async def get_next_curator() -> Optional[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT value FROM meta WHERE key='next_curator_idx'")
+# Запросы, которые выполняются на каждое действие пользователя или куратора.
+# Ни один из них не должен приводить к полному просмотру submissions или users.
+HOT_QUERIES = {
+    "user_task_state": (USER_TASK_STATE_SQL, (0,)),
+    "user_lookup": ("SELECT curator_idx, fio FROM users WHERE tg_id=?", (0,)),
+    "curator_lookup": ("SELECT idx, fio FROM curators WHERE telegram_id=?", (0,)),
+    "curator_pending": ("SELECT pending_count FROM curators WHERE idx=?", (0,)),
+    "curator_queue": (CLAIM_NEXT_SQL, (0, "", "", 0, 0, "")),
+    "assign_curator": (ASSIGN_CURATOR_SQL, ()),
+    "submission_media": (
+        "SELECT submission_id, kind, file_id FROM submission_media WHERE submission_id IN (?) "
+        "ORDER BY submission_id, ordinal", (0,)),
+}
+
+
+# большие таблицы и их псевдонимы в HOT_QUERIES
+BIG_TABLES = ("submissions", "users", "s", "u")
+
+
+async def check_hot_query_plans(db: aiosqlite.Connection) -> List[str]:
+    """Прогоняет EXPLAIN QUERY PLAN для HOT_QUERIES и пишет в лог запросы с полным сканированием таблиц."""
+    problems = []
+    for name, (sql, params) in HOT_QUERIES.items():
+        cur = await db.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        for row in await cur.fetchall():
+            detail = row[-1]
+            # "SCAN <таблица>" — полный просмотр (в том числе по индексу) одной из больших таблиц
+            if detail.startswith("SCAN ") and detail.split()[1] in BIG_TABLES:
+                problems.append(f"{name}: {detail}")
+    for problem in problems:
+        logging.warning(f"⚠️ Полное сканирование в горячем запросе — {problem}")
+    return problems
+
+
+@timed("register_user")
+async def register_user(tg_id: int, fio: str, acad_group: str) -> Optional[dict]:
+    """Назначает участнику наименее загруженного куратора и сохраняет его одной транзакцией."""
+    async with db_pool.write() as db:
+        cur = await db.execute(ASSIGN_CURATOR_SQL)
         row = await cur.fetchone()
-        if not row:
-            return None
-        next_idx = int(row[0])
-        cur2 = await db.execute("SELECT idx, fio, telegram_id FROM curators ORDER BY idx")
-        all_cur = await cur2.fetchall()
-        if not all_cur:
-            return None
-        # find curator with idx = next_idx, if not exists, wrap
-        chosen = None
-        for r in all_cur:
-            if r[0] == next_idx:
-                chosen = r
-                break
-        if not chosen:
-            chosen = all_cur[0]
-            next_idx = chosen[0]
-        # compute new next
-        # next index is next in list; if last, go to first
-        idxs = [r[0] for r in all_cur]
-        pos = idxs.index(chosen[0])
-        new_pos = (pos + 1) % len(idxs)
-        new_next = idxs[new_pos]
-        await db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_curator_idx', ?)", (str(new_next),))
-        await db.commit()
-        return {"idx": chosen[0], "fio": chosen[1], "telegram_id": chosen[2]}
+        curator = {"idx": row[0], "fio": row[1], "telegram_id": row[2]} if row else None
+        await db.execute("INSERT INTO users (tg_id, fio, acad_group, curator_idx, points) VALUES (?,?,?,?,0)",
+                         (tg_id, fio, acad_group, curator["idx"] if curator else None))
+    return curator
 
 
 # ---- Utility functions ----
@@ -353,29 +1133,6 @@ def task_by_id(tid: int) -> dict:
     raise ValueError("task not found")
 
 
-async def user_has_accepted_count(user_id: int) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT COUNT(*) FROM submissions WHERE user_id=? AND status='accepted'", (user_id,))
-        r = await cur.fetchone()
-        return r[0]
-
-
-async def submission_pending_for_task(user_id: int, task_id: int) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT COUNT(*) FROM submissions WHERE user_id=? AND task_id=? AND status='pending'",
-                               (user_id, task_id))
-        r = await cur.fetchone()
-        return r[0] > 0
-
-
-async def submission_accepted_for_task(user_id: int, task_id: int) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT COUNT(*) FROM submissions WHERE user_id=? AND task_id=? AND status='accepted'",
-                               (user_id, task_id))
-        r = await cur.fetchone()
-        return r[0] > 0
-
-
 def task_action_keyboard(task_id: int) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.button(text="Отправить ответ", callback_data=f"send_{task_id}")
@@ -400,40 +1157,41 @@ async def cmd_start(message: types.Message, state: FSMContext):
     args = message.text.split(maxsplit=1)
     if len(args) > 1 and args[1].startswith("curator_invite_"):
         token = args[1].replace("curator_invite_", "")
-        async with aiosqlite.connect(DB_PATH) as db:
+        fio = message.from_user.full_name
+        async with db_pool.write() as db:
             cur = await db.execute("SELECT value FROM meta WHERE key=?", (f"curator_token_{token}",))
             row = await cur.fetchone()
-            if not row or row[0] != "valid":
-                await message.answer("❌ Ссылка недействительна или уже использована.")
-                return
-
-            # Добавляем пользователя как куратора, если его ещё нет
-            cur2 = await db.execute("SELECT COUNT(*) FROM curators WHERE telegram_id=?", (message.from_user.id,))
-            count = (await cur2.fetchone())[0]
-            if count == 0:
-                fio = message.from_user.full_name
-                await db.execute("INSERT INTO curators (fio, telegram_id) VALUES (?, ?)", (fio, message.from_user.id))
-                await db.commit()
-                await message.answer(f"✅ Вы успешно добавлены в список кураторов, {fio}!")
-            else:
-                await message.answer("✅ Вы уже есть в списке кураторов.")
-
-            # Можно сделать, чтобы ссылка была одноразовой:
-            await db.execute("DELETE FROM meta WHERE key=?", (f"curator_token_{token}",))
-            await db.commit()
+            valid = bool(row and row[0] == "valid")
+            added = False
+            if valid:
+                # Добавляем пользователя как куратора, если его ещё нет
+                cur2 = await db.execute("SELECT COUNT(*) FROM curators WHERE telegram_id=?", (message.from_user.id,))
+                count = (await cur2.fetchone())[0]
+                if count == 0:
+                    await db.execute("INSERT INTO curators (fio, telegram_id) VALUES (?, ?)",
+                                     (fio, message.from_user.id))
+                    added = True
+
+                # Можно сделать, чтобы ссылка была одноразовой:
+                await db.execute("DELETE FROM meta WHERE key=?", (f"curator_token_{token}",))
+
+        if not valid:
+            await message.answer("❌ Ссылка недействительна или уже использована.")
+        elif added:
+            await message.answer(f"✅ Вы успешно добавлены в список кураторов, {fio}!")
+        else:
+            await message.answer("✅ Вы уже есть в списке кураторов.")
         return
 
     # Если не приглашение — обычная регистрация
     tg_id = message.from_user.id
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT fio FROM users WHERE tg_id=?", (tg_id,))
-        r = await cur.fetchone()
-        if r:
-            await message.answer(
-                "Вы уже зарегистрированы. Вот список заданий:",
-                reply_markup=await tasks_keyboard_for_user(tg_id)
-            )
-            return
+    user_state = await load_user_task_state(tg_id)
+    if user_state.registered:
+        await message.answer(
+            "Вы уже зарегистрированы. Вот список заданий:",
+            reply_markup=await tasks_keyboard_for_user(tg_id, user_state)
+        )
+        return
     await message.answer(
         "Привет! Добро пожаловать в бот конкурса «Староста года»! Для начала напишите, пожалуйста, свое ФИО:"
     )
@@ -453,13 +1211,6 @@ def confirm_keyboard(entity_type: str, entity_id: int) -> InlineKeyboardMarkup:
     return kb.as_markup()
 
 
-async def is_submissions_closed() -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT value FROM meta WHERE key='submissions_closed'")
-        row = await cur.fetchone()
-        return row and row[0] == "true"
-
-
 # === Команда админа: включить/выключить приём заданий ===
 @dp.message(Command("stop_submissions"))
 async def cmd_stop_submissions(message: types.Message):
@@ -467,7 +1218,7 @@ async def cmd_stop_submissions(message: types.Message):
         await message.answer("❌ Команда доступна только администратору.")
         return
 
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with db_pool.write() as db:
         cur = await db.execute("SELECT value FROM meta WHERE key='submissions_closed'")
         row = await cur.fetchone()
         closed = row and row[0] == "true"
@@ -475,6 +1226,8 @@ async def cmd_stop_submissions(message: types.Message):
         new_state = "false" if closed else "true"
         await db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('submissions_closed', ?)", (new_state,))
         await db.commit()
+    # флаг приёма входит в состояние каждого участника
+    user_state_cache.clear()
 
     if new_state == "true":
         await message.answer("🚫 Приём заданий остановлен. Бот больше не принимает ответы от участников.")
@@ -493,7 +1246,7 @@ async def cmd_check_unlinked(message: types.Message):
 
     await message.answer("🔍 Проверяю базу на наличие неподключённых пользователей...")
 
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with db_pool.read() as db:
         # --- 1️⃣ Пользователи, которых нет в таблице users, но есть submissions ---
         cur = await db.execute("""
             SELECT DISTINCT s.user_id 
@@ -558,7 +1311,7 @@ async def cmd_delete_user(message: types.Message):
         await message.answer("⚠️ Укажите корректный Telegram ID пользователя.")
         return
 
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with db_pool.read() as db:
         cur = await db.execute("SELECT fio, acad_group FROM users WHERE tg_id=?", (user_id,))
         user = await cur.fetchone()
 
@@ -594,7 +1347,7 @@ async def cmd_delete_curator(message: types.Message):
         await message.answer("⚠️ Укажите корректный Telegram ID куратора.")
         return
 
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with db_pool.read() as db:
         cur = await db.execute("SELECT fio FROM curators WHERE telegram_id=?", (curator_tg,))
         row = await cur.fetchone()
 
@@ -613,6 +1366,121 @@ async def cmd_delete_curator(message: types.Message):
     )
 
 
+# === Перераспределение участников между кураторами ===
+def plan_rebalance(curator_idxs: List[int], users: List[Tuple[int, Optional[int], int]]) -> Dict[int, int]:
+    """
+    Строит перенос участников {tg_id: новый curator_idx}.
+
+    users — (tg_id, curator_idx, число ожидающих ответов). После переноса у кураторов поровну
+    участников (±1) при минимальном числе переносов. Участники без действующего куратора
+    распределяются обязательно. Переносимые участники достаются тем, у кого меньше непроверенных ответов.
+    """
+    if not curator_idxs:
+        return {}
+    by_curator: Dict[int, list] = {idx: [] for idx in curator_idxs}
+    pool = []
+    for tg_id, idx, pending in users:
+        (by_curator[idx] if idx in by_curator else pool).append((pending, tg_id))
+
+    base, extra = divmod(len(users), len(curator_idxs))
+    # лишнее место (+1) получают те, у кого участников уже больше, — так меньше переносов
+    order = sorted(curator_idxs, key=lambda i: (-len(by_curator[i]), i))
+    target = {idx: base + (1 if pos < extra else 0) for pos, idx in enumerate(order)}
+    avg_pending = sum(p for _, _, p in users) / len(curator_idxs)
+
+    for idx in curator_idxs:
+        members = by_curator[idx]
+        surplus = len(members) - target[idx]
+        if surplus <= 0:
+            continue
+        # отдаём участников так, чтобы у куратора осталось около среднего числа ответов
+        ideal = (sum(p for p, _ in members) - avg_pending) / surplus
+        members.sort(key=lambda m: (abs(m[0] - ideal), m[1]))
+        pool.extend(members[:surplus])
+        del members[:surplus]
+
+    load = {idx: sum(p for p, _ in members) for idx, members in by_curator.items()}
+    moves = {}
+    for pending, tg_id in sorted(pool, reverse=True):
+        idx = min((i for i in curator_idxs if len(by_curator[i]) < target[i]), key=lambda i: (load[i], i))
+        by_curator[idx].append((pending, tg_id))
+        load[idx] += pending
+        moves[tg_id] = idx
+    return moves
+
+
+async def rebalance_curators(removed_idx: Optional[int] = None) -> dict:
+    """
+    Перераспределяет участников одной транзакцией; при removed_idx куратор удаляется,
+    а его участники расходятся по остальным.
+    """
+    async with db_pool.write() as db:
+        cur = await db.execute("SELECT idx, telegram_id FROM curators WHERE idx IS NOT ?", (removed_idx,))
+        curators = dict(await cur.fetchall())
+        cur = await db.execute("SELECT tg_id, curator_idx, pending_count FROM users")
+        users = await cur.fetchall()
+        moves = plan_rebalance(sorted(curators), users)
+        old_idx = {tg_id: idx for tg_id, idx, _ in users}
+
+        await db.executemany("UPDATE users SET curator_idx=? WHERE tg_id=?",
+                             [(idx, tg_id) for tg_id, idx in moves.items()])
+        # закреплённые за прежним куратором ответы снова свободны
+        await db.executemany(
+            "UPDATE submissions SET claimed_by=NULL, claim_expires_at=NULL WHERE user_id=? AND status='pending'",
+            [(tg_id,) for tg_id in moves])
+        if removed_idx is not None:
+            await db.execute("DELETE FROM curators WHERE idx=?", (removed_idx,))
+        await db.execute(COUNTER_REPAIRS["curators.users_count"])
+
+        cur = await db.execute("SELECT idx, users_count, pending_count FROM curators")
+        loads = {idx: (users_count, pending) for idx, users_count, pending in await cur.fetchall()}
+
+    gained: Dict[int, int] = {}
+    lost: Dict[int, int] = {}
+    for tg_id, idx in moves.items():
+        gained[idx] = gained.get(idx, 0) + 1
+        if old_idx[tg_id] in curators:
+            lost[old_idx[tg_id]] = lost.get(old_idx[tg_id], 0) + 1
+    return {"moves": moves, "gained": gained, "lost": lost, "loads": loads, "curators": curators}
+
+
+async def notify_rebalanced_curators(result: dict):
+    """Одно сообщение каждому затронутому куратору, все отправки — одной пачкой через общий ограничитель."""
+    sends = []
+    for idx in sorted(set(result["gained"]) | set(result["lost"])):
+        users_count, pending = result["loads"][idx]
+        text = (
+            f"🔄 Участники перераспределены: +{result['gained'].get(idx, 0)} / -{result['lost'].get(idx, 0)}.\n"
+            f"Сейчас у вас участников: {users_count}, непроверенных ответов: {pending}."
+        )
+        sends.append(send_broadcast_message(result["curators"][idx], text))
+    await asyncio.gather(*sends)
+
+
+def after_rebalance(result: dict):
+    # у перенесённых участников сменился куратор
+    if result["moves"]:
+        user_state_cache.clear()
+        review_prefetcher.drop()
+
+
+@dp.message(Command("rebalance"))
+async def cmd_rebalance(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("Команда доступна только администратору")
+        return
+    result = await rebalance_curators()
+    after_rebalance(result)
+    if not result["moves"]:
+        await message.answer("⚖️ Участники уже распределены равномерно.")
+        return
+    await notify_rebalanced_curators(result)
+    lines = [f"⚖️ Перенесено участников: {len(result['moves'])}", ""]
+    for idx, (users_count, pending) in sorted(result["loads"].items()):
+        lines.append(f"idx={idx}: {users_count} участников, {pending} pending")
+    await message.answer("\n".join(lines))
+
+
 # === Обработка подтверждения удаления ===
 @dp.callback_query(lambda c: c.data.startswith("confirm_delete_"))
 async def confirm_deletion(cb: types.CallbackQuery):
@@ -625,45 +1493,41 @@ async def confirm_deletion(cb: types.CallbackQuery):
     entity_id = int(parts[3])
 
     if entity_type == "user":
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with db_pool.write() as db:
             # Удаляем данные пользователя
+            await db.execute(
+                "UPDATE curators SET users_count = users_count - 1 "
+                "WHERE idx = (SELECT curator_idx FROM users WHERE tg_id=?)",
+                (entity_id,))
             await db.execute("DELETE FROM submissions WHERE user_id=?", (entity_id,))
             await db.execute("DELETE FROM users WHERE tg_id=?", (entity_id,))
             await db.commit()
+        user_state_cache.invalidate(entity_id)
         await cb.message.edit_text(f"🗑 Данные пользователя (ID {entity_id}) успешно удалены.")
 
     elif entity_type == "curator":
-        async with aiosqlite.connect(DB_PATH) as db:
-            # Получаем индекс удаляемого куратора
+        async with db_pool.read() as db:
             cur = await db.execute("SELECT idx, fio FROM curators WHERE telegram_id=?", (entity_id,))
             row = await cur.fetchone()
-            if not row:
-                await cb.message.edit_text("❌ Куратор не найден.")
-                return
-            idx, fio = row
+            cur = await db.execute("SELECT COUNT(*) FROM curators")
+            curators_total = (await cur.fetchone())[0]
 
-            # Получаем список всех кураторов
-            cur = await db.execute("SELECT idx, telegram_id FROM curators ORDER BY idx")
-            all_cur = await cur.fetchall()
-
-            if len(all_cur) <= 1:
-                await cb.message.edit_text("⚠️ Нельзя удалить последнего куратора.")
-                return
-
-            # Определяем нового куратора для переназначения
-            ids = [c[0] for c in all_cur]
-            pos = ids.index(idx)
-            new_curator = all_cur[(pos + 1) % len(ids)]  # следующий по кругу
-            new_idx, new_tg = new_curator
+        if not row:
+            await cb.message.edit_text("❌ Куратор не найден.")
+            return
+        if curators_total <= 1:
+            await cb.message.edit_text("⚠️ Нельзя удалить последнего куратора.")
+            return
 
-            # Обновляем пользователей
-            await db.execute("UPDATE users SET curator_idx=? WHERE curator_idx=?", (new_idx, idx))
-            await db.execute("DELETE FROM curators WHERE idx=?", (idx,))
-            await db.commit()
+        # участники удалённого куратора расходятся по остальным, а не достаются одному
+        idx, fio = row
+        result = await rebalance_curators(removed_idx=idx)
+        after_rebalance(result)
+        await notify_rebalanced_curators(result)
 
         await cb.message.edit_text(
             f"🗑 Куратор *{fio}* удалён.\n"
-            f"👥 Его участники переназначены куратору с ID {new_tg}.",
+            f"👥 Его участники распределены между кураторами: {len(result['gained'])}.",
             parse_mode="Markdown"
         )
 
@@ -689,7 +1553,7 @@ async def gen_curator_link(message: types.Message):
     link = f"https://t.me/{(await bot.me()).username}?start=curator_invite_{token}"
 
     # можно сохранить токен в БД, если хочешь ограничить срок действия
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with db_pool.write() as db:
         await db.execute(
             "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
             (f"curator_token_{token}", "valid"),
@@ -704,10 +1568,15 @@ async def cmd_export(message: types.Message):
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("Команда доступна только администратору.")
         return
-    loop = asyncio.get_running_loop()
+    await message.answer("⏳ Экспортирую рейтинг в Google Sheets...")
     try:
-        await loop.run_in_executor(None, lambda: asyncio.run(export_to_google_sheets()))
-        await message.answer("✅ Рейтинг успешно экспортирован в Google Sheets.")
+        result = await sheets_exporter.export_now()
+        await message.answer(
+            f"✅ Рейтинг успешно экспортирован в Google Sheets.\n\n"
+            f"👥 Участников: {result.rows}\n"
+            f"✏️ Записано ячеек: {result.cells} (режим: {result.mode})\n"
+            f"📊 Всего ячеек за экспорты: {sheets_exporter.cells_written}"
+        )
     except Exception as e:
         await message.answer(f"❌ Ошибка при экспорте: {e}")
 
@@ -724,23 +1593,17 @@ async def cmd_tasks(message: types.Message):
 @dp.message(Command("profile"))
 async def cmd_profile(message: types.Message):
     tg_id = message.from_user.id
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with db_pool.read() as db:
         # Проверяем, зарегистрирован ли пользователь
-        cur = await db.execute("SELECT fio, acad_group, points FROM users WHERE tg_id=?", (tg_id,))
+        cur = await db.execute(
+            "SELECT fio, acad_group, points, accepted_count, pending_count FROM users WHERE tg_id=?", (tg_id,))
         user = await cur.fetchone()
-        if not user:
-            await message.answer("❌ Вы ещё не зарегистрированы. Отправьте /start, чтобы начать.")
-            return
-
-        fio, acad_group, points = user
 
-        # Подсчитываем задания
-        cur_done = await db.execute("SELECT COUNT(*) FROM submissions WHERE user_id=? AND status='accepted'", (tg_id,))
-        done = (await cur_done.fetchone())[0]
+    if not user:
+        await message.answer("❌ Вы ещё не зарегистрированы. Отправьте /start, чтобы начать.")
+        return
 
-        cur_pending = await db.execute("SELECT COUNT(*) FROM submissions WHERE user_id=? AND status='pending'",
-                                       (tg_id,))
-        pending = (await cur_pending.fetchone())[0]
+    fio, acad_group, points, done, pending = user
 
     # Форматируем красивый вывод
     profile_text = (
@@ -756,111 +1619,544 @@ async def cmd_profile(message: types.Message):
     await message.answer(profile_text, parse_mode="Markdown")
 
 
+# ===== статистика кураторов =====
+# Все показатели по всем кураторам — одним запросом с группировкой.
+# Медиана времени проверки (updated_at - created_at решённых ответов) считается оконными функциями.
+CURATOR_STATS_SQL = """
+    WITH decided AS (
+        SELECT u.curator_idx AS idx,
+               (julianday(s.updated_at) - julianday(s.created_at)) * 86400 AS review_s
+        FROM submissions s
+        JOIN users u ON u.tg_id = s.user_id
+        WHERE s.status IN ('accepted', 'rejected')
+    ),
+    ranked AS (
+        SELECT idx, review_s,
+               ROW_NUMBER() OVER (PARTITION BY idx ORDER BY review_s) AS rn,
+               COUNT(*) OVER (PARTITION BY idx) AS cnt
+        FROM decided
+        WHERE review_s IS NOT NULL
+    ),
+    medians AS (
+        SELECT idx, AVG(review_s) AS median_s
+        FROM ranked
+        WHERE rn IN ((cnt + 1) / 2, (cnt + 2) / 2)
+        GROUP BY idx
+    ),
+    totals AS (
+        SELECT u.curator_idx AS idx,
+               SUM(s.status = 'pending') AS pending,
+               SUM(s.status = 'accepted') AS accepted,
+               SUM(s.status = 'rejected') AS rejected,
+               MIN(CASE WHEN s.status = 'pending' THEN s.created_at END) AS oldest_pending
+        FROM submissions s
+        JOIN users u ON u.tg_id = s.user_id
+        GROUP BY u.curator_idx
+    )
+    SELECT c.idx, c.fio, c.telegram_id, c.users_count,
+           COALESCE(t.pending, 0), COALESCE(t.accepted, 0), COALESCE(t.rejected, 0),
+           (julianday('now') - julianday(t.oldest_pending)) * 86400,
+           m.median_s
+    FROM curators c
+    LEFT JOIN totals t ON t.idx = c.idx
+    LEFT JOIN medians m ON m.idx = c.idx
+    ORDER BY c.idx
+"""
+STATS_PAGE_SIZE = 8  # кураторов на странице
+STATS_CACHE_SECONDS = 5  # листание страниц в пределах этого окна не пересчитывает статистику
+
+
+@dataclass
+class CuratorStats:
+    idx: int
+    fio: str
+    telegram_id: int
+    users: int
+    pending: int
+    accepted: int
+    rejected: int
+    oldest_pending_s: Optional[float]
+    median_review_s: Optional[float]
+
+
+_curator_stats: Optional[Tuple[float, List[CuratorStats]]] = None
+
+
+@timed("curator_stats")
+async def load_curator_stats(fresh: bool = False) -> List[CuratorStats]:
+    global _curator_stats
+    if not fresh and _curator_stats and time.monotonic() - _curator_stats[0] < STATS_CACHE_SECONDS:
+        return _curator_stats[1]
+    async with db_pool.read() as db:
+        cur = await db.execute(CURATOR_STATS_SQL)
+        stats = [CuratorStats(*row) for row in await cur.fetchall()]
+    _curator_stats = (time.monotonic(), stats)
+    return stats
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "—"
+    seconds = int(max(seconds, 0))
+    days, rest = divmod(seconds, 86400)
+    hours, rest = divmod(rest, 3600)
+    minutes, secs = divmod(rest, 60)
+    if days:
+        return f"{days} д {hours} ч"
+    if hours:
+        return f"{hours} ч {minutes} мин"
+    if minutes:
+        return f"{minutes} мин"
+    return f"{secs} с"
+
+
+def stats_page_text(stats: List[CuratorStats], page: int) -> str:
+    pages = max((len(stats) + STATS_PAGE_SIZE - 1) // STATS_PAGE_SIZE, 1)
+    lines = [
+        f"📊 Кураторы: {len(stats)} · стр. {page + 1}/{pages}",
+        f"Всего: ⏳ {sum(c.pending for c in stats)} · ✅ {sum(c.accepted for c in stats)} · "
+        f"❌ {sum(c.rejected for c in stats)}",
+        "",
+    ]
+    for c in stats[page * STATS_PAGE_SIZE:(page + 1) * STATS_PAGE_SIZE]:
+        lines.append(f"{c.fio} (idx={c.idx}, tg={c.telegram_id})")
+        lines.append(f"👥 {c.users} · ⏳ {c.pending} · ✅ {c.accepted} · ❌ {c.rejected}")
+        lines.append(f"🕰 Ждёт дольше всех: {format_duration(c.oldest_pending_s)} · "
+                     f"⏱ Медиана проверки: {format_duration(c.median_review_s)}")
+        lines.append("")
+    return "\n".join(lines).rstrip()
+
+
+def stats_page_kb(page: int, total: int) -> InlineKeyboardMarkup:
+    pages = max((total + STATS_PAGE_SIZE - 1) // STATS_PAGE_SIZE, 1)
+    builder = InlineKeyboardBuilder()
+    if page > 0:
+        builder.button(text="◀️", callback_data=f"stats_page_{page - 1}")
+    builder.button(text="🔄", callback_data=f"stats_refresh_{page}")
+    if page < pages - 1:
+        builder.button(text="▶️", callback_data=f"stats_page_{page + 1}")
+    return builder.as_markup()
+
+
 # Команда админа посмотреть статистику кураторов
 @dp.message(Command('stats'))
 async def cmd_stats(message: types.Message):
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("Команда доступна только администратору")
         return
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT idx, fio, telegram_id FROM curators ORDER BY idx")
-        rows = await cur.fetchall()
-        lines = []
-        for r in rows:
-            idx, fio, tg = r
-            cur2 = await db.execute(
-                "SELECT COUNT(*) FROM submissions WHERE status='pending' AND user_id IN (SELECT tg_id FROM users WHERE curator_idx=?)",
-                (idx,))
-            pending = (await cur2.fetchone())[0]
-            lines.append(f"{fio} (idx={idx}, tg={tg}): {pending} pending")
-    await message.answer("\n".join(lines) if lines else "Кураторы не найдены")
+    stats = await load_curator_stats()
+    if not stats:
+        await message.answer("Кураторы не найдены")
+        return
+    await message.answer(stats_page_text(stats, 0), reply_markup=stats_page_kb(0, len(stats)))
 
 
-@dp.message(Command("broadcast"))
-async def cmd_broadcast(message: types.Message, state: FSMContext):
-    """Команда для начала рассылки всем пользователям"""
+@dp.callback_query(lambda c: c.data.startswith("stats_page_") or c.data.startswith("stats_refresh_"))
+async def stats_page(cb: types.CallbackQuery):
+    if cb.from_user.id not in ADMIN_IDS:
+        await cb.answer("Недостаточно прав.", show_alert=True)
+        return
+    stats = await load_curator_stats(fresh=cb.data.startswith("stats_refresh_"))
+    pages = max((len(stats) + STATS_PAGE_SIZE - 1) // STATS_PAGE_SIZE, 1)
+    page = min(int(cb.data.split("_")[-1]), pages - 1)
+    try:
+        await cb.message.edit_text(stats_page_text(stats, page), reply_markup=stats_page_kb(page, len(stats)))
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e).lower():
+            raise
+    await cb.answer()
+
+
+# ===== задержки проверки =====
+# Для каждого ответа хранятся три метки: created_at (попал в очередь), shown_at (впервые показан
+# куратору) и decided_at (решение). Ожидание — shown_at - created_at, решение — decided_at - shown_at.
+# Проверявший куратор — claimed_by: после решения закрепление остаётся за ним.
+REVIEW_LATENCY_SQL = """
+    SELECT s.claimed_by, c.fio, s.task_id,
+           (julianday(s.shown_at) - julianday(s.created_at)) * 86400,
+           (julianday(s.decided_at) - julianday(s.shown_at)) * 86400
+    FROM submissions s
+    LEFT JOIN curators c ON c.telegram_id = s.claimed_by
+    WHERE s.decided_at >= ?
+"""
+REVIEW_STATS_HOURS = 24  # окно /review_stats по умолчанию
+
+
+def latency_line(title: str, waits: List[float], decisions: List[float], decided: int, hours: float) -> str:
+    line = f"{title}: {decided} реш. ({decided / hours:.1f}/ч)"
+    if waits:
+        line += (f"\n   ⏳ ожидание p50 {format_duration(percentile(waits, 50))}, "
+                 f"p95 {format_duration(percentile(waits, 95))}")
+    if decisions:
+        line += (f"\n   🧐 решение p50 {format_duration(percentile(decisions, 50))}, "
+                 f"p95 {format_duration(percentile(decisions, 95))}")
+    return line
+
+
+@timed("review_latency")
+async def review_latency_report(hours: float) -> List[str]:
+    """Перцентили ожидания и решения за последние hours часов: по кураторам (сначала самые медленные) и по заданиям."""
+    since = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+    async with db_pool.read() as db:
+        cur = await db.execute(REVIEW_LATENCY_SQL, (since,))
+        rows = await cur.fetchall()
+
+    by_curator: Dict[Any, Tuple[List[float], List[float], List[int]]] = {}
+    by_task: Dict[int, Tuple[List[float], List[float], List[int]]] = {}
+    names = {}
+    for curator_tg, fio, task_id, wait, decision in rows:
+        names[curator_tg] = fio or (f"tg={curator_tg}" if curator_tg else "неизвестно")
+        for groups, key in ((by_curator, curator_tg), (by_task, task_id)):
+            waits, decisions, decided = groups.setdefault(key, ([], [], [0]))
+            decided[0] += 1
+            # у ответов, проверенных до появления меток, времени показа нет
+            if wait is not None:
+                waits.append(wait)
+                decisions.append(decision)
+
+    header = f"⏱ Проверка за {hours:g} ч: {len(rows)} решений ({len(rows) / hours:.1f}/ч)"
+    if not rows:
+        return [header]
+    curators = sorted(by_curator.items(), key=lambda kv: -percentile(kv[1][0], 95))
+    curator_lines = [header, "", "👩‍🏫 По кураторам (сначала самое долгое ожидание):"]
+    curator_lines += [latency_line(names[key], w, d, n[0], hours) for key, (w, d, n) in curators]
+    task_lines = ["📚 По заданиям:"]
+    task_lines += [latency_line(f"Задание {key}", w, d, n[0], hours) for key, (w, d, n) in sorted(by_task.items())]
+    return ["\n".join(curator_lines), "\n".join(task_lines)]
+
+
+@dp.message(Command("review_stats"))
+async def cmd_review_stats(message: types.Message):
     if message.from_user.id not in ADMIN_IDS:
-        await message.answer("❌ Команда доступна только главным администраторам.")
+        await message.answer("Команда доступна только администратору")
+        return
+    args = message.text.split()[1:]
+    try:
+        hours = float(args[0]) if args else REVIEW_STATS_HOURS
+    except ValueError:
+        hours = 0
+    if hours <= 0:
+        await message.answer("Использование: /review_stats [часы]")
         return
+    for text in await review_latency_report(hours):
+        for i in range(0, len(text), 4000):
+            await message.answer(text[i:i + 4000])
 
-    await message.answer("✉️ Введите текст рассылки, который хотите отправить всем пользователям.\n\n"
-                         "_Можно использовать форматирование Markdown._", parse_mode="Markdown")
-    await state.set_state(BroadcastState.waiting_for_message)
 
+@dp.message(Command("cache_stats"))
+async def cmd_cache_stats(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("Команда доступна только администратору")
+        return
+    await message.answer(
+        user_state_cache.stats_text()
+        + f"\n\n📦 Предзагрузка очереди кураторов\n"
+          f"✅ Из буфера: {review_prefetcher.hits}\n"
+          f"❌ Мимо буфера: {review_prefetcher.misses}"
+    )
 
-@dp.message(BroadcastState.waiting_for_message)
-async def process_broadcast_message(message: types.Message, state: FSMContext):
-    text = message.text.strip()
-    await state.clear()
 
-    if not text:
-        await message.answer("⚠️ Текст рассылки не может быть пустым.")
+@dp.message(Command("check_counters"))
+async def cmd_check_counters(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("Команда доступна только администратору")
+        return
+    # пересчёт и исправление — одной транзакцией, чтобы не поймать ответ посередине
+    repaired = {}
+    async with db_pool.write() as db:
+        for name, sql in COUNTER_REPAIRS.items():
+            cur = await db.execute(sql)
+            repaired[name] = cur.rowcount
+    lines = ["🧮 Проверка счётчиков", ""]
+    for name, count in repaired.items():
+        lines.append(f"{'✅' if not count else '🛠'} {name}: исправлено строк {count}")
+    if any(repaired.values()):
+        user_state_cache.clear()
+        logging.warning(f"⚠️ Счётчики разошлись с данными и исправлены: {repaired}")
+    await message.answer("\n".join(lines))
+
+
+@dp.message(Command("perf"))
+async def cmd_perf(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("Команда доступна только администратору")
+        return
+    args = message.text.split()[1:]
+    if args and args[0] == "reset":
+        perf_metrics.reset()
+        await message.answer("⏱ Замеры сброшены")
         return
+    # /perf handler — только хендлеры, /perf fn — только горячие функции
+    text = perf_metrics.report_text(args[0] if args else "")
+    # полный отчёт по всем хендлерам и функциям длиннее лимита Telegram в 4096 символов
+    for i in range(0, len(text), 4000):
+        await message.answer(text[i:i + 4000])
+
+
+# ===== движок рассылок =====
+class TokenBucket:
+    """Ограничитель скорости: в среднем не больше rate событий в секунду, всплески до capacity."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Остановить выдачу токенов (Telegram ответил RetryAfter — лимит общий для бота)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+        self._updated = self._paused_until
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+broadcast_limiter = TokenBucket(BROADCAST_RATE)
+
+
+# ===== очередь рассылок (таблица broadcast_jobs) =====
+BROADCAST_JOB_COLUMNS = ("id", "text", "chat_id", "message_id", "status", "cursor",
+                         "total", "delivered", "failed", "blocked", "created_at")
+broadcast_wakeup = asyncio.Event()
+
+
+async def enqueue_broadcast_job(text: str, created_by: int, chat_id: int, message_id: int, total: int) -> int:
+    now = datetime.utcnow().isoformat()
+    async with db_pool.write() as db:
+        cur = await db.execute(
+            "INSERT INTO broadcast_jobs (text, created_by, chat_id, message_id, total, created_at) "
+            "VALUES (?,?,?,?,?,?)",
+            (text, created_by, chat_id, message_id, total, now))
+        job_id = cur.lastrowid
+    broadcast_wakeup.set()
+    return job_id
 
-    await message.answer("🚀 Начинаю рассылку всем пользователям...")
 
-    delivered = 0
-    failed = 0
+async def next_broadcast_job() -> Optional[dict]:
+    """Самая старая незавершённая рассылка — прерванная перезапуском или ожидающая в очереди."""
+    async with db_pool.read() as db:
+        cur = await db.execute(
+            f"SELECT {', '.join(BROADCAST_JOB_COLUMNS)} FROM broadcast_jobs "
+            "WHERE status IN ('running', 'queued') ORDER BY id LIMIT 1")
+        row = await cur.fetchone()
+    return dict(zip(BROADCAST_JOB_COLUMNS, row)) if row else None
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT tg_id FROM users")
-        all_users = [r[0] for r in await cur.fetchall()]
 
-    total = len(all_users)
-    if total == 0:
-        await message.answer("❌ Нет зарегистрированных пользователей для рассылки.")
-        return
+async def mark_broadcast_job(job_id: int, status: str):
+    now = datetime.utcnow().isoformat()
+    column = "started_at" if status == "running" else "finished_at"
+    async with db_pool.write() as db:
+        await db.execute(f"UPDATE broadcast_jobs SET status=?, {column}=COALESCE({column}, ?) WHERE id=?",
+                         (status, now, job_id))
+
 
-    # Отправляем по очереди с небольшой задержкой (чтобы не словить flood limit)
-    for i, user_id in enumerate(all_users, 1):
+async def save_broadcast_job(job: dict):
+    async with db_pool.write() as db:
+        await db.execute(
+            "UPDATE broadcast_jobs SET cursor=?, delivered=?, failed=?, blocked=? WHERE id=?",
+            (job["cursor"], job["delivered"], job["failed"], job["blocked"], job["id"]))
+
+
+async def send_broadcast_message(user_id: int, text: str) -> str:
+    """Отправляет одно сообщение рассылки. Возвращает 'delivered', 'blocked' или 'failed'."""
+    for _ in range(BROADCAST_MAX_RETRIES):
+        await broadcast_limiter.acquire()
         try:
             await bot.send_message(user_id, text, parse_mode="Markdown")
-            delivered += 1
+            return "delivered"
+        except TelegramRetryAfter as e:
+            logging.warning(f"Flood limit при рассылке, пауза {e.retry_after} с")
+            broadcast_limiter.pause(e.retry_after)
+        except TelegramForbiddenError:
+            return "blocked"  # пользователь заблокировал бота
         except Exception as e:
             logging.warning(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
-            failed += 1
+            return "failed"
+    return "failed"
+
+
+def broadcast_progress_text(job: dict, finished: bool = False) -> str:
+    processed = job["delivered"] + job["failed"] + job["blocked"]
+    if finished:
+        return (
+            f"✅ Рассылка завершена!\n\n"
+            f"📤 Отправлено: {job['delivered']}\n"
+            f"🚫 Заблокировали бота: {job['blocked']}\n"
+            f"⚠️ Ошибок: {job['failed']}\n"
+            f"👥 Всего пользователей: {job['total']}"
+        )
+    return (f"📬 Рассылка: {processed}/{job['total']} обработано "
+            f"(✅ {job['delivered']}, 🚫 {job['blocked']}, ❌ {job['failed']})")
 
-        # обновляем статус каждые 10 сообщений
-        if i % 10 == 0 or i == total:
-            try:
-                await message.answer(f"📬 Рассылка: {i}/{total} обработано "
-                                     f"(✅ {delivered}, ❌ {failed})")
-            except Exception:
-                pass  # чтобы не спамил в консоль
 
-        await asyncio.sleep(0.2)  # минимальная пауза между отправками
+async def show_broadcast_progress(job: dict, finished: bool = False):
+    """Обновляет одно и то же сообщение с прогрессом вместо отправки новых."""
+    try:
+        await bot.edit_message_text(broadcast_progress_text(job, finished),
+                                    chat_id=job["chat_id"], message_id=job["message_id"])
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e).lower():
+            logging.warning(f"Не удалось обновить прогресс рассылки: {e}")
 
-    summary = (
-        f"✅ Рассылка завершена!\n\n"
-        f"📤 Отправлено: {delivered}\n"
-        f"⚠️ Ошибок: {failed}\n"
-        f"👥 Всего пользователей: {total}"
-    )
-    await message.answer(summary)
-    logging.info(summary)
 
+async def run_broadcast(job: dict):
+    """
+    Рассылает job["text"] всем пользователям по возрастанию tg_id.
 
-@dp.message(StartStates.waiting_for_fio)
-async def process_fio(message: types.Message, state: FSMContext):
-    fio = message.text.strip()
-    await state.update_data(fio=fio)
-    await message.answer("Спасибо! Теперь напишите, пожалуйста, номер своей академической группы:")
-    await state.set_state(StartStates.waiting_for_group)
+    Отправка идёт пачками с ограниченной параллельностью и общим token bucket; после каждой
+    пачки курсор и счётчики сохраняются в строку задания broadcast_jobs (save_broadcast_job), поэтому
+    после перезапуска рассылка продолжается с места остановки (см. broadcast_worker).
+    """
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
 
+    async def send_one(user_id: int) -> str:
+        async with semaphore:
+            return await send_broadcast_message(user_id, job["text"])
 
-@dp.message(StartStates.waiting_for_group)
-async def process_group(message: types.Message, state: FSMContext):
+    last_progress = 0.0
+    while True:
+        async with db_pool.read() as db:
+            cur = await db.execute("SELECT tg_id FROM users WHERE tg_id > ? ORDER BY tg_id LIMIT ?",
+                                   (job["cursor"], BROADCAST_CHUNK_SIZE))
+            chunk = [r[0] for r in await cur.fetchall()]
+        if not chunk:
+            break
+
+        for outcome in await asyncio.gather(*(send_one(uid) for uid in chunk)):
+            job[outcome] += 1
+        job["cursor"] = chunk[-1]
+        await save_broadcast_job(job)
+
+        if time.monotonic() - last_progress >= BROADCAST_PROGRESS_INTERVAL:
+            await show_broadcast_progress(job)
+            last_progress = time.monotonic()
+
+    await mark_broadcast_job(job["id"], "done")
+    await show_broadcast_progress(job, finished=True)
+    logging.info(f"📬 Рассылка #{job['id']}: " + broadcast_progress_text(job, finished=True))
+
+
+async def broadcast_worker():
+    """
+    Фоновая задача: по одной выполняет рассылки из broadcast_jobs.
+
+    Запускается в on_startup; рассылка, прерванная перезапуском (status='running'),
+    продолжается первой — с сохранённого курсора.
+    """
+    while True:
+        broadcast_wakeup.clear()
+        job = await next_broadcast_job()
+        if job is None:
+            await broadcast_wakeup.wait()
+            continue
+
+        if job["status"] == "running":
+            logging.info(f"📬 Возобновляю рассылку #{job['id']} после tg_id={job['cursor']}")
+        else:
+            await mark_broadcast_job(job["id"], "running")
+        try:
+            await run_broadcast(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.exception(f"❌ Ошибка в рассылке #{job['id']}, повтор через минуту")
+            await asyncio.sleep(60)
+
+
+@dp.message(Command("broadcasts"))
+async def cmd_broadcasts(message: types.Message):
+    """Последние рассылки и их прогресс."""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("❌ Команда доступна только главным администраторам.")
+        return
+
+    async with db_pool.read() as db:
+        cur = await db.execute(
+            f"SELECT {', '.join(BROADCAST_JOB_COLUMNS)} FROM broadcast_jobs ORDER BY id DESC LIMIT 10")
+        jobs = [dict(zip(BROADCAST_JOB_COLUMNS, row)) for row in await cur.fetchall()]
+
+    if not jobs:
+        await message.answer("📭 Рассылок ещё не было.")
+        return
+
+    status_icons = {"queued": "🕒", "running": "🚀", "done": "✅"}
+    lines = ["📬 Последние рассылки:\n"]
+    for job in jobs:
+        processed = job["delivered"] + job["failed"] + job["blocked"]
+        lines.append(
+            f"{status_icons.get(job['status'], '❔')} #{job['id']} ({(job['created_at'] or '')[:16]}): "
+            f"{processed}/{job['total']} — ✅ {job['delivered']}, 🚫 {job['blocked']}, ❌ {job['failed']}\n"
+            f"   «{job['text'][:40]}»"
+        )
+    await message.answer("\n".join(lines))
+
+
+@dp.message(Command("broadcast"))
+async def cmd_broadcast(message: types.Message, state: FSMContext):
+    """Команда для начала рассылки всем пользователям"""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("❌ Команда доступна только главным администраторам.")
+        return
+
+    await message.answer("✉️ Введите текст рассылки, который хотите отправить всем пользователям.\n\n"
+                         "_Можно использовать форматирование Markdown._", parse_mode="Markdown")
+    await state.set_state(BroadcastState.waiting_for_message)
+
+
+@dp.message(BroadcastState.waiting_for_message)
+async def process_broadcast_message(message: types.Message, state: FSMContext):
+    text = message.text.strip()
+    await state.clear()
+
+    if not text:
+        await message.answer("⚠️ Текст рассылки не может быть пустым.")
+        return
+
+    async with db_pool.read() as db:
+        cur = await db.execute("SELECT COUNT(*) FROM users")
+        total = (await cur.fetchone())[0]
+
+    if total == 0:
+        await message.answer("❌ Нет зарегистрированных пользователей для рассылки.")
+        return
+
+    progress = await message.answer("🚀 Рассылка поставлена в очередь...")
+    job_id = await enqueue_broadcast_job(text, message.from_user.id, progress.chat.id, progress.message_id, total)
+    logging.info(f"📬 Рассылка #{job_id} поставлена в очередь ({total} получателей)")
+
+
+@dp.message(StartStates.waiting_for_fio)
+async def process_fio(message: types.Message, state: FSMContext):
+    fio = message.text.strip()
+    await state.update_data(fio=fio)
+    await message.answer("Спасибо! Теперь напишите, пожалуйста, номер своей академической группы:")
+    await state.set_state(StartStates.waiting_for_group)
+
+
+@dp.message(StartStates.waiting_for_group)
+async def process_group(message: types.Message, state: FSMContext):
     acad_group = message.text.strip()
     data = await state.get_data()
     fio = data.get("fio")
     tg_id = message.from_user.id
     # assign curator
-    curator = await get_next_curator()
-    curator_idx = curator["idx"] if curator else None
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("INSERT INTO users (tg_id, fio, acad_group, curator_idx, points) VALUES (?,?,?,?,0)",
-                         (tg_id, fio, acad_group, curator_idx))
-        await db.commit()
+    curator = await register_user(tg_id, fio, acad_group)
+    user_state_cache.invalidate(tg_id)
     await message.answer(
         f"✅ Регистрация завершена!\n"
         f"Ваш куратор: {curator['fio'] if curator else 'не назначен'}.\n"
@@ -918,19 +2214,10 @@ async def back_to_tasks(cb: types.CallbackQuery):
 async def on_task_selected(cb: types.CallbackQuery):
     task_id = int(cb.data.split('_')[1])
     user_id = cb.from_user.id
-    # check 13th availability
-    if task_id == 14:
-        accepted_count = await user_has_accepted_count(user_id)
-        if accepted_count < 3:
-            await cb.answer("Супер-задание доступно только после выполнения как минимум 3 заданий.", show_alert=True)
-            return
-    # check already accepted
-    if await submission_accepted_for_task(user_id, task_id):
-        await cb.answer("Вы уже выполнили это задание и оно зачтено.", show_alert=True)
-        return
-    # check pending
-    if await submission_pending_for_task(user_id, task_id):
-        await cb.answer("У вас уже есть решение этого задания на проверке.", show_alert=True)
+    # зачтено / на проверке / супер-задание недоступно — одним запросом
+    block_reason = (await load_user_task_state(user_id)).task_block_reason(task_id)
+    if block_reason:
+        await cb.answer(block_reason, show_alert=True)
         return
     t = task_by_id(task_id)
     details = TASKS_DETAILS.get(task_id, {})
@@ -957,44 +2244,33 @@ async def on_send_answer(cb: types.CallbackQuery, state: FSMContext):
     task_id = int(cb.data.split('_')[1])
     user_id = cb.from_user.id
 
-    # Проверки
-    if await is_submissions_closed():
+    # Проверки — все данные берём одним запросом
+    user_state = await load_user_task_state(user_id)
+    if user_state.submissions_closed:
         await cb.answer("🚫 Приём заданий завершён. Спасибо за участие!", show_alert=True)
         return
     # --- Проверяем, зарегистрирован ли пользователь и есть ли у него куратор ---
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT curator_idx FROM users WHERE tg_id=?", (user_id,))
-        row = await cur.fetchone()
-
-        if not row:
-            await cb.answer(
-                "🚫 Вы ещё не зарегистрированы!\n\n"
-                "Используйте команду /start для регистрации.\n\n"
-                "Также подпишитесь на канал поддержки @SG_RNIMU_tech — там публикуются важные объявления "
-                "и можно задать вопрос техподдержке.",
-                show_alert=True
-            )
-            return
-
-        curator_idx = row[0]
-        if curator_idx is None:
-            await cb.answer(
-                "⚠️ У вас пока не назначен куратор. Пожалуйста, обратитесь в техподдержку @SG_RNIMU_tech",
-                show_alert=True
-            )
-            return
+    if not user_state.registered:
+        await cb.answer(
+            "🚫 Вы ещё не зарегистрированы!\n\n"
+            "Используйте команду /start для регистрации.\n\n"
+            "Также подпишитесь на канал поддержки @SG_RNIMU_tech — там публикуются важные объявления "
+            "и можно задать вопрос техподдержке.",
+            show_alert=True
+        )
+        return
 
-    if await submission_accepted_for_task(user_id, task_id):
-        await cb.answer("Вы уже выполнили это задание и оно зачтено.", show_alert=True)
+    if user_state.curator_idx is None:
+        await cb.answer(
+            "⚠️ У вас пока не назначен куратор. Пожалуйста, обратитесь в техподдержку @SG_RNIMU_tech",
+            show_alert=True
+        )
         return
-    if await submission_pending_for_task(user_id, task_id):
-        await cb.answer("У вас уже есть решение этого задания на проверке.", show_alert=True)
+
+    block_reason = user_state.task_block_reason(task_id)
+    if block_reason:
+        await cb.answer(block_reason, show_alert=True)
         return
-    if task_id == 14:
-        accepted_count = await user_has_accepted_count(user_id)
-        if accepted_count < 3:
-            await cb.answer("Супер-задание доступно только после выполнения как минимум 3 заданий.", show_alert=True)
-            return
 
     # Получаем задание
     t = task_by_id(task_id)
@@ -1028,7 +2304,7 @@ async def on_send_answer(cb: types.CallbackQuery, state: FSMContext):
 
 @dp.message(AnswerFSM.waiting_for_photo, F.photo)
 async def handle_photo_for_task(message: types.Message, state: FSMContext):
-    await state.update_data(photo_id=message.photo[-1].file_id)
+    await state.update_data(photo=media_item("photo", message.photo[-1]))
     await state.set_state(AnswerFSM.waiting_for_text)
     await message.answer("✍ Теперь отправьте текстовое пояснение:")
 
@@ -1038,26 +2314,11 @@ async def handle_text_for_task(message: types.Message, state: FSMContext):
     data = await state.get_data()
     task_id = data["task_id"]
     user_id = message.from_user.id
-    photo_id = data["photo_id"]
+    # состояние могло сохраниться в старом формате (только file_id)
+    photo = data.get("photo") or {"kind": "photo", "file_id": data["photo_id"]}
     text = message.text.strip()
 
-    content_type = "photo_text"
-    content = f"photo:{photo_id}|text:{text}"
-    now = datetime.utcnow().isoformat()
-
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT INTO submissions (user_id, task_id, status, content_type, content, created_at, updated_at) "
-            "VALUES (?,?,?,?,?,?,?)",
-            (user_id, task_id, 'pending', content_type, content, now, now),
-        )
-        await db.commit()
-        cur2 = await db.execute("SELECT curator_idx, fio FROM users WHERE tg_id=?", (user_id,))
-        u = await cur2.fetchone()
-        curator_idx, user_name = u[0], u[1]
-        cur3 = await db.execute("SELECT telegram_id FROM curators WHERE idx=?", (curator_idx,))
-        c = await cur3.fetchone()
-        curator_tg = c[0] if c else None
+    curator_idx, curator_tg = await save_submission(user_id, task_id, "photo_text", text, [photo])
 
     await message.answer("✅ Ваш ответ отправлен куратору.")
     await cmd_tasks(message)
@@ -1071,6 +2332,8 @@ async def handle_text_for_task(message: types.Message, state: FSMContext):
 def curator_start_check_kb() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     builder.button(text="Начать проверку ▶️", callback_data="curator_start_check")
+    builder.button(text="Пакетная проверка текстов 📝", callback_data="batch_start")
+    builder.adjust(1)
     return builder.as_markup()
 
 
@@ -1085,12 +2348,10 @@ def curator_check_kb(submission_id: int) -> InlineKeyboardMarkup:
 
 # ===== при появлении нового ответа от студента =====
 async def notify_curator_new_answer(curator_tg: int, curator_idx: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
-            "SELECT COUNT(*) FROM submissions WHERE status='pending' "
-            "AND user_id IN (SELECT tg_id FROM users WHERE curator_idx=?)",
-            (curator_idx,))
-        pending_count = (await cur.fetchone())[0]
+    async with db_pool.read() as db:
+        cur = await db.execute("SELECT pending_count FROM curators WHERE idx=?", (curator_idx,))
+        row = await cur.fetchone()
+        pending_count = row[0] if row else 0
 
     await bot.send_message(
         curator_tg,
@@ -1113,36 +2374,114 @@ async def handle_done_command(message: types.Message, state: FSMContext):
         await message.answer("⚠️ Команда /done используется только для заданий с типом фото/видео.")
         return
 
-    collected = data.get("collected_media", [])
+    collected = as_media_items(data.get("collected_media", []))
     if not collected:
         await message.answer("❗ Вы ещё не отправили ни одного фото или видео.")
         return
 
-    content_type = "photo_video"
-    content = "|".join(collected)
-    now = datetime.utcnow().isoformat()
+    curator_idx, curator_tg = await save_submission(user_id, task_id, "photo_video", media=collected[:10])
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT INTO submissions (user_id, task_id, status, content_type, content, created_at, updated_at) "
-            "VALUES (?,?,?,?,?,?,?)",
-            (user_id, task_id, 'pending', content_type, content, now, now),
+    await message.answer("✅ Все медиа получены и отправлены куратору.")
+    if curator_tg:
+        await notify_curator_new_answer(curator_tg, curator_idx)
+
+    await state.clear()
+
+
+def media_item(kind: str, media: Any) -> dict:
+    """Элемент ответа для submission_media из PhotoSize / Video / VideoNote (так же хранится в FSM)."""
+    return {"kind": kind, "file_id": media.file_id, "file_unique_id": media.file_unique_id}
+
+
+def as_media_items(items: list) -> List[dict]:
+    # в FSM могли остаться элементы старого формата 'photo:<file_id>'
+    return [
+        {"kind": item.partition(":")[0], "file_id": item.partition(":")[2], "file_unique_id": None}
+        if isinstance(item, str) else item
+        for item in items
+    ]
+
+
+async def save_submission(user_id: int, task_id: int, content_type: str, text: Optional[str] = None,
+                          media: List[dict] = ()) -> Tuple[Optional[int], Optional[int]]:
+    """Сохраняет ответ на проверку. Возвращает (curator_idx, telegram_id куратора) участника."""
+    now = datetime.utcnow().isoformat()
+    async with db_pool.write() as db:
+        cur = await db.execute(
+            "INSERT INTO submissions (user_id, task_id, status, content_type, text, created_at, updated_at) "
+            "VALUES (?,?,?,?,?,?,?) RETURNING id",
+            (user_id, task_id, 'pending', content_type, text, now, now),
+        )
+        submission_id = (await cur.fetchone())[0]
+        await db.executemany(
+            "INSERT INTO submission_media (submission_id, ordinal, kind, file_id, file_unique_id) VALUES (?,?,?,?,?)",
+            [(submission_id, n, m["kind"], m["file_id"], m.get("file_unique_id")) for n, m in enumerate(media)],
         )
         await db.commit()
 
         # получаем куратора
-        cur2 = await db.execute("SELECT curator_idx, fio FROM users WHERE tg_id=?", (user_id,))
+        cur2 = await db.execute("SELECT curator_idx FROM users WHERE tg_id=?", (user_id,))
         u = await cur2.fetchone()
-        curator_idx, user_name = u[0], u[1]
+        curator_idx = u[0] if u else None
         cur3 = await db.execute("SELECT telegram_id FROM curators WHERE idx=?", (curator_idx,))
         c = await cur3.fetchone()
         curator_tg = c[0] if c else None
+    user_state_cache.invalidate(user_id)
+    return curator_idx, curator_tg
 
-    await message.answer("✅ Все медиа получены и отправлены куратору.")
-    if curator_tg:
-        await notify_curator_new_answer(curator_tg, curator_idx)
 
-    await state.clear()
+class MediaGroupAggregator:
+    """
+    Собирает части альбома (media group), которые Telegram присылает отдельными сообщениями.
+
+    Ключ — (участник, media_group_id). Каждая новая часть откладывает сборку ещё на delay секунд,
+    после последней части on_flush вызывается ровно один раз со всеми частями в порядке message_id,
+    даже если они пришли не по порядку.
+    """
+
+    def __init__(self, delay: float):
+        self._delay = delay
+        self._groups: Dict[Tuple[int, str], dict] = {}
+        self._flushing: Set[asyncio.Task] = set()
+
+    def add(self, user_id: int, media_group_id: Optional[str], message_id: int, item: Any,
+            on_flush: Callable[[List[Any]], Awaitable[None]]):
+        key = (user_id, media_group_id or "")
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = {"items": [], "timer": None, "on_flush": on_flush}
+        group["items"].append((message_id, item))
+        # обработчик последней пришедшей части видит самое свежее состояние диалога
+        group["on_flush"] = on_flush
+        if group["timer"] is not None:
+            group["timer"].cancel()
+        group["timer"] = asyncio.get_running_loop().call_later(self._delay, self._flush, key)
+
+    def _flush(self, key: Tuple[int, str]):
+        group = self._groups.pop(key, None)
+        if group is None:
+            return
+        items = [item for _, item in sorted(group["items"], key=lambda part: part[0])]
+        task = asyncio.create_task(self._run(group["on_flush"], items))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    @staticmethod
+    async def _run(on_flush: Callable[[List[Any]], Awaitable[None]], items: List[Any]):
+        try:
+            await on_flush(items)
+        except Exception:
+            logging.exception("❌ Ошибка при обработке альбома")
+
+    async def stop(self):
+        """Досрочно собирает все недополученные альбомы и ждёт их обработки."""
+        for key in list(self._groups):
+            self._groups[key]["timer"].cancel()
+            self._flush(key)
+        await asyncio.gather(*self._flushing, return_exceptions=True)
+
+
+media_groups = MediaGroupAggregator(ALBUM_FLUSH_DELAY)
 
 
 @dp.message(SubmitStates.waiting_for_answer)
@@ -1155,15 +2494,14 @@ async def receive_answer(message: types.Message, state: FSMContext):
     is_text = bool(message.text and message.text.strip())
     is_photo = bool(message.photo)
     is_video = bool(message.video or message.video_note)
-    is_media_group = hasattr(message, "media_group_id")  # альбом (несколько фото/видео)
 
     valid = False
-    content_type, content = None, None
+    content_type, text, media = None, None, []
 
     # === text ===
     if required == 'text' and is_text:
         valid = True
-        content_type, content = 'text', message.text.strip()
+        content_type, text = 'text', message.text.strip()
 
     # === photo / photo_multi ===
     elif required in ('photo', 'photo_multi') and is_photo:
@@ -1171,166 +2509,91 @@ async def receive_answer(message: types.Message, state: FSMContext):
             # одиночное фото
             valid = True
             content_type = 'photo'
-            content = message.photo[-1].file_id
+            media = [media_item("photo", message.photo[-1])]
         else:
             # === сбор альбома ===
-            data = await state.get_data()
-            current_group_id = data.get("media_group_id")
-            collected = data.get("collected_photos", [])
-            group_id = message.media_group_id
-
-            # если новое media_group_id — сбрасываем коллекцию
-            if current_group_id != group_id:
-                collected = []
-                await state.update_data(media_group_id=group_id)
-
-            collected.append(message.photo[-1].file_id)
-            await state.update_data(collected_photos=collected)
-
-            # запускаем отложенную отправку альбома
-            async def finalize_album():
-                await asyncio.sleep(1.5)  # ждём пока Telegram дошлёт остальные фото
+            async def finalize_album(photos: List[dict]):
+                # ответ отправляется, только если участник всё ещё отвечает на это задание
                 state_data = await state.get_data()
-                if state_data.get("media_group_id") == group_id:
-                    photos = state_data.get("collected_photos", [])
-                    if not photos:
-                        return
-                    valid_local = True
-                    content_type_local = "photo_multi"
-                    content_local = "|".join(f"photo:{pid}" for pid in photos)
-
-                    # очищаем временные данные
-                    await state.update_data(collected_photos=[], media_group_id=None)
-
-                    now = datetime.utcnow().isoformat()
-                    async with aiosqlite.connect(DB_PATH) as db:
-                        await db.execute(
-                            "INSERT INTO submissions (user_id, task_id, status, content_type, content, created_at, updated_at) "
-                            "VALUES (?,?,?,?,?,?,?)",
-                            (user_id, task_id, 'pending', content_type_local, content_local, now, now),
-                        )
-                        await db.commit()
-
-                        cur2 = await db.execute("SELECT curator_idx FROM users WHERE tg_id=?", (user_id,))
-                        curator_idx = (await cur2.fetchone())[0]
-                        cur3 = await db.execute("SELECT telegram_id FROM curators WHERE idx=?", (curator_idx,))
-                        curator_tg = (await cur3.fetchone())[0]
-
-                    await message.answer("✅ Ваш альбом успешно отправлен куратору на проверку.")
-                    await cmd_tasks(message)
-                    if curator_tg:
-                        await notify_curator_new_answer(curator_tg, curator_idx)
-                    await state.clear()
-
-            # запускаем сбор альбома в фоне
-            asyncio.create_task(finalize_album())
+                if await state.get_state() != SubmitStates.waiting_for_answer.state or state_data.get("task_id") != task_id:
+                    return
+                curator_idx, curator_tg = await save_submission(user_id, task_id, "photo_multi", media=photos)
+
+                await message.answer("✅ Ваш альбом успешно отправлен куратору на проверку.")
+                await cmd_tasks(message)
+                if curator_tg:
+                    await notify_curator_new_answer(curator_tg, curator_idx)
+                await state.clear()
+
+            # отдельные фото, присланные подряд, собираются так же, как части одного альбома
+            media_groups.add(user_id, message.media_group_id, message.message_id,
+                             media_item("photo", message.photo[-1]), finalize_album)
             return
 
     # === video ===
     elif required == 'video' and is_video:
         valid = True
-        content_type, content = 'video', (message.video or message.video_note).file_id
+        content_type, media = 'video', [media_item("video", message.video or message.video_note)]
 
     # === photo_text ===
     elif required == 'photo_text' and (is_photo and is_text):
         valid = True
-        content_type = 'photo_text'
-        content = f"photo:{message.photo[-1].file_id}|text:{message.text.strip()}"
+        content_type, text = 'photo_text', message.text.strip()
+        media = [media_item("photo", message.photo[-1])]
 
     # === photo_video (расширенный тип) ===
-    elif required == 'photo_video':
-        media_ids = []
-
-        # Обработка фото
+    elif required == 'photo_video' and (is_photo or is_video):
         if is_photo:
-            media_ids.append(f"photo:{message.photo[-1].file_id}")
-            prev_media = (await state.get_data()).get("collected_media", [])
-            prev_media += media_ids
-            await state.update_data(collected_media=prev_media)
+            item = media_item("photo", message.photo[-1])
+        else:
+            item = media_item("video", message.video or message.video_note)
 
-            if len(prev_media) < 10:
-                if not message.media_group_id:
-                    await message.answer(
-                        "📸 Медиа получено. Можете отправить ещё фото или видео, либо напишите /done когда закончите.\n\n"
-                        "*Суммарное количество всех отправленных фото/видео не должно быть больше 10!*",
-                        parse_mode="Markdown"
-                    )
+        async def collect_media(items: List[dict]):
+            state_data = await state.get_data()
+            if await state.get_state() != SubmitStates.waiting_for_answer.state or state_data.get("task_id") != task_id:
                 return
-            else:
-                collected = prev_media[:10]
-                valid = True
-                content_type = "photo_video"
-                content = "|".join(collected)
-                await message.answer(
-                    "❗ Достигнут лимит в 10 медиафайлов!\n\nОтвет автоматически отправляется куратору на проверку!"
-                )
-
-        # Обработка видео
-        if is_video:
-            vid = message.video or message.video_note
-            media_ids.append(f"video:{vid.file_id}")
-            prev_media = (await state.get_data()).get("collected_media", [])
-            prev_media += media_ids
-            await state.update_data(collected_media=prev_media)
-
+            prev_media = as_media_items(state_data.get("collected_media", [])) + items
             if len(prev_media) < 10:
-                if not message.media_group_id:
-                    await message.answer(
-                        "📸 Медиа получено. Можете отправить ещё фото или видео, либо напишите /done когда закончите.\n\n"
-                        "*Суммарное количество всех отправленных фото/видео не должно быть больше 10!*",
-                        parse_mode="Markdown"
-                    )
-                return
-            else:
-                collected = prev_media[:10]
-                valid = True
-                content_type = "photo_video"
-                content = "|".join(collected)
+                await state.update_data(collected_media=prev_media)
                 await message.answer(
-                    "❗ Достигнут лимит в 10 медиафайлов!\n\nОтвет автоматически отправляется куратору на проверку!"
+                    "📸 Медиа получено. Можете отправить ещё фото или видео, либо напишите /done когда закончите.\n\n"
+                    "*Суммарное количество всех отправленных фото/видео не должно быть больше 10!*",
+                    parse_mode="Markdown"
                 )
-
-        # # Если одиночное фото или видео — принимаем сразу
-        # if media_ids:
-        #     valid = True
-        #     content_type = 'photo_video'
-        #     content = "|".join(media_ids)
+                return
+            await message.answer(
+                "❗ Достигнут лимит в 10 медиафайлов!\n\nОтвет автоматически отправляется куратору на проверку!"
+            )
+            curator_idx, curator_tg = await save_submission(user_id, task_id, "photo_video", media=prev_media[:10])
+            await message.answer("✅ Ваш ответ отправлен на проверку куратору.")
+            await cmd_tasks(message)
+            if curator_tg:
+                await notify_curator_new_answer(curator_tg, curator_idx)
+            await state.clear()
+
+        if message.media_group_id:
+            # альбом добавляется в ответ целиком, одним обновлением состояния
+            media_groups.add(user_id, message.media_group_id, message.message_id, item, collect_media)
+        else:
+            await collect_media([item])
+        return
 
     # === Завершение отправки альбома (/done) ===
     elif message.text and message.text.strip().lower() == "/done" and required == "photo_video":
-        collected = (await state.get_data()).get("collected_media", [])
+        collected = as_media_items((await state.get_data()).get("collected_media", []))
         if not collected:
             await message.answer("❗ Вы ещё не отправили ни одного фото или видео.")
             return
-        if len(collected) > 10:
-            collected = collected[:10]
         valid = True
-        content_type = "photo_video"
-        content = "|".join(collected)
+        content_type, media = "photo_video", collected[:10]
 
     # === Ошибка формата ===
     if not valid:
         await message.answer("⚠️ Неподходящий тип ответа. Пожалуйста, отправьте ответ с подходящим типом!")
         return
 
-    now = datetime.utcnow().isoformat()
-
     # === Запись в базу ===
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT INTO submissions (user_id, task_id, status, content_type, content, created_at, updated_at) "
-            "VALUES (?,?,?,?,?,?,?)",
-            (user_id, task_id, 'pending', content_type, content, now, now),
-        )
-        await db.commit()
-
-        # получаем куратора
-        cur2 = await db.execute("SELECT curator_idx, fio FROM users WHERE tg_id=?", (user_id,))
-        u = await cur2.fetchone()
-        curator_idx, user_name = u[0], u[1]
-        cur3 = await db.execute("SELECT telegram_id FROM curators WHERE idx=?", (curator_idx,))
-        c = await cur3.fetchone()
-        curator_tg = c[0] if c else None
+    curator_idx, curator_tg = await save_submission(user_id, task_id, content_type, text, media)
 
     await message.answer("✅ Ваш ответ отправлен на проверку куратору.")
     await cmd_tasks(message)
@@ -1343,202 +2606,395 @@ async def receive_answer(message: types.Message, state: FSMContext):
 # ===== куратор нажал 'Начать проверку' =====
 @dp.callback_query(lambda c: c.data == "curator_start_check")
 async def curator_start_check(cb: types.CallbackQuery):
+    # явный старт — начинаем с самого старого ответа, включая ранее закреплённые за куратором
+    review_prefetcher.drop(cb.from_user.id)
     await send_next_submission_to_curator(cb.from_user.id)
     await cb.answer()
 
 
-# ===== выдаём куратору следующий ответ =====
-async def send_next_submission_to_curator(curator_tg: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        while True:
-            cur = await db.execute("""
-                SELECT s.id, s.user_id, s.task_id, s.content_type, s.content, u.fio
-                FROM submissions s
-                JOIN users u ON u.tg_id = s.user_id
-                WHERE s.status='pending' 
-                  AND u.curator_idx=(SELECT idx FROM curators WHERE telegram_id=?)
-                ORDER BY s.created_at ASC
-                LIMIT 1
-            """, (curator_tg,))
-            row = await cur.fetchone()
-
-            # нет заданий
-            if not row:
-                await bot.send_message(curator_tg, "✅ Все задания проверены.")
-                asyncio.create_task(export_to_google_sheets())
-                return
-
-            submission_id, user_id, task_id, content_type, content, user_name = row
-
-            # 🔍 проверяем, не зачтено ли уже это задание у пользователя
-            cur2 = await db.execute("""
-                SELECT COUNT(*) FROM submissions 
-                WHERE user_id=? AND task_id=? AND status='accepted'
-            """, (user_id, task_id))
-            already_accepted = (await cur2.fetchone())[0] > 0
+@dataclass
+class ReviewItem:
+    """Ответ, подготовленный к показу куратору: разобранное содержимое и готовые InputMedia."""
+    submission_id: int
+    user_id: int
+    task_id: int
+    content_type: str
+    user_name: str
+    text: str = ""
+    media: List[types.InputMedia] = field(default_factory=list)
+
+
+def build_review_item(submission_id: int, user_id: int, task_id: int, content_type: str, text: Optional[str],
+                      user_name: str, media: List[Tuple[str, str]]) -> ReviewItem:
+    item = ReviewItem(submission_id, user_id, task_id, content_type, user_name, text or "")
+    for kind, file_id in media:
+        if kind == "photo":
+            item.media.append(types.InputMediaPhoto(media=file_id))
+        elif kind == "video":
+            item.media.append(types.InputMediaVideo(media=file_id))
+    return item
+
+
+async def load_submission_media(db: aiosqlite.Connection, submission_ids: List[int]) -> Dict[int, List[Tuple[str, str]]]:
+    """Медиа нескольких ответов одним запросом по первичному ключу: {submission_id: [(вид, file_id), ...]}."""
+    media: Dict[int, List[Tuple[str, str]]] = {sid: [] for sid in submission_ids}
+    if not submission_ids:
+        return media
+    cur = await db.execute(
+        f"SELECT submission_id, kind, file_id FROM submission_media "
+        f"WHERE submission_id IN ({','.join('?' * len(submission_ids))}) ORDER BY submission_id, ordinal",
+        tuple(submission_ids),
+    )
+    for submission_id, kind, file_id in await cur.fetchall():
+        media[submission_id].append((kind, file_id))
+    return media
 
-            if already_accepted:
-                # Удаляем дубликат, не показываем куратору
-                await db.execute("DELETE FROM submissions WHERE id=?", (submission_id,))
-                await db.commit()
-                continue  # берём следующее (если есть)
 
-            # если не зачтено — показываем куратору
-            break
+async def safe_send_captioned_photo(chat_id: int, photo_id: str, caption: str):
+    # Telegram caption limit ≈ 1024. Обрезаем и отправляем остаток отдельным сообщением.
+    if not caption:
+        await bot.send_photo(chat_id, photo_id)
+        return
+    caption_to_send = caption[:1024]
+    remainder = caption[1024:]
+    try:
+        await bot.send_photo(chat_id, photo_id, caption=caption_to_send)
+    except TelegramBadRequest:
+        # если с caption не получилось, отправим фото без caption
+        await bot.send_photo(chat_id, photo_id)
+        # и отправим caption как текст (в кусках по 4000)
+        if caption_to_send:
+            for i in range(0, len(caption), 4000):
+                await bot.send_message(chat_id, caption[i:i + 4000])
+        return
+    # если был остаток — отправляем как отдельный текст
+    if remainder:
+        for i in range(0, len(remainder), 4000):
+            await bot.send_message(chat_id, remainder[i:i + 4000])
 
-    t = task_by_id(task_id)
 
-    async def safe_send_captioned_photo(chat_id: int, photo_id: str, caption: str):
-        # Telegram caption limit ≈ 1024. Обрезаем и отправляем остаток отдельным сообщением.
-        if not caption:
-            await bot.send_photo(chat_id, photo_id)
-            return
-        caption_to_send = caption[:1024]
-        remainder = caption[1024:]
-        try:
-            await bot.send_photo(chat_id, photo_id, caption=caption_to_send)
-        except TelegramBadRequest:
-            # если с caption не получилось, отправим фото без caption
-            await bot.send_photo(chat_id, photo_id)
-            # и отправим caption как текст (в кусках по 4000)
-            if caption_to_send:
-                for i in range(0, len(caption), 4000):
-                    await bot.send_message(chat_id, caption[i:i + 4000])
-            return
-        # если был остаток — отправляем как отдельный текст
-        if remainder:
-            for i in range(0, len(remainder), 4000):
-                await bot.send_message(chat_id, remainder[i:i + 4000])
+async def safe_send_media_group(chat_id: int, media_list: List[types.InputMedia]):
+    try:
+        await bot.send_media_group(chat_id, media=media_list)
+    except TelegramBadRequest as e:
+        # fallback: отправляем по одному элементу (без caption)
+        for m in media_list:
+            try:
+                if isinstance(m, types.InputMediaPhoto):
+                    await bot.send_photo(chat_id, m.media)
+                elif isinstance(m, types.InputMediaVideo):
+                    await bot.send_video(chat_id, m.media)
+            except Exception:
+                logging.exception("Ошибка при fallback-отправке медиа куратору")
 
-    async def safe_send_media_group(chat_id: int, media_list: List[types.InputMedia]):
-        try:
-            await bot.send_media_group(chat_id, media=media_list)
-        except TelegramBadRequest as e:
-            # fallback: отправляем по одному элементу (без caption)
-            for m in media_list:
-                try:
-                    if isinstance(m, types.InputMediaPhoto):
-                        await bot.send_photo(chat_id, m.media)
-                    elif isinstance(m, types.InputMediaVideo):
-                        await bot.send_video(chat_id, m.media)
-                except Exception:
-                    logging.exception("Ошибка при fallback-отправке медиа куратору")
 
+async def send_review_item(curator_tg: int, item: ReviewItem):
     # отправка в зависимости от типа
-    if content_type == "text":
+    if item.content_type == "text":
         try:
-            await bot.send_message(curator_tg, f"📝 Ответ:\n{content}")
+            await bot.send_message(curator_tg, f"📝 Ответ:\n{item.text}")
         except Exception:
             logging.exception("Failed to send text to curator")
 
-    elif content_type == "photo":
-        text_msg = ""  # если нужно: получить подпись из БД/других полей
-        await safe_send_captioned_photo(curator_tg, content, text_msg)
-
-    elif content_type == "video":
-        try:
-            await bot.send_video(curator_tg, content)
-        except TelegramBadRequest:
-            # если ошибка — отправим ссылку/ид без подписи
-            await bot.send_message(curator_tg,
-                                   "Не удалось отправить видео напрямую. Пожалуйста, проверьте исходный файл.")
-
-    elif content_type == "photo_text":
-        parts = content.split("|")
-        photo_id = parts[0].split(":")[1]
-        text_msg = parts[1].split(":", 1)[1] if len(parts) > 1 else ""
-        await safe_send_captioned_photo(curator_tg, photo_id, text_msg)
-
-    elif content_type == "photo_multi":
-        media_parts = content.split("|")
-        media_group = [
-            types.InputMediaPhoto(media=part.replace("photo:", ""))
-            for part in media_parts if part.startswith("photo:")
-        ]
-        if len(media_group) == 1:
-            await bot.send_photo(curator_tg, media_group[0].media)
-        elif len(media_group) > 1:
-            await safe_send_media_group(curator_tg, media_group)
-
-    elif content_type == "photo_video":
-        media_parts = content.split("|")
-        media_group = []
-        for part in media_parts:
-            if part.startswith("photo:"):
-                media_group.append(types.InputMediaPhoto(media=part.replace("photo:", "")))
-            elif part.startswith("video:"):
-                media_group.append(types.InputMediaVideo(media=part.replace("video:", "")))
-        if len(media_group) == 1:
-            m = media_group[0]
-            if isinstance(m, types.InputMediaPhoto):
-                await bot.send_photo(curator_tg, m.media)
-            elif isinstance(m, types.InputMediaVideo):
+    elif len(item.media) == 1:
+        m = item.media[0]
+        if isinstance(m, types.InputMediaPhoto):
+            await safe_send_captioned_photo(curator_tg, m.media, item.text)
+        else:
+            try:
                 await bot.send_video(curator_tg, m.media)
-        elif len(media_group) > 1:
-            await safe_send_media_group(curator_tg, media_group)
+            except TelegramBadRequest:
+                # если ошибка — отправим ссылку/ид без подписи
+                await bot.send_message(curator_tg,
+                                       "Не удалось отправить видео напрямую. Пожалуйста, проверьте исходный файл.")
+
+    elif len(item.media) > 1:
+        await safe_send_media_group(curator_tg, item.media)
 
+    t = task_by_id(item.task_id)
     info_text = (
         f"📋 *Задание {t['id']}. {t['title']}*\n"
-        f"👤 От участника: {user_name}\n"
-        f"🆔 Submission ID: {submission_id}"
+        f"👤 От участника: {item.user_name}\n"
+        f"🆔 Submission ID: {item.submission_id}"
     )
 
     await bot.send_message(
         curator_tg,
         info_text,
         parse_mode="Markdown",
-        reply_markup=curator_check_kb(submission_id)
+        reply_markup=curator_check_kb(item.submission_id)
     )
 
 
-# ===== куратор зачёл =====
-@dp.callback_query(lambda c: c.data.startswith("cur_accept_"))
-async def curator_accept(cb: types.CallbackQuery):
-    submission_id = int(cb.data.split('_')[-1])
-    curator_tg = cb.from_user.id
+# Следующие ответы из очереди куратора, которые можно заранее подготовить к показу:
+# ничьи или с истёкшей арендой, без уже зачтённого варианта.
+# Параметры: telegram_id куратора, текущее время, лимит.
+REVIEW_CANDIDATES_SQL = """
+    SELECT s.id, s.user_id, s.task_id, s.content_type, s.text, u.fio
+    FROM submissions s
+    JOIN users u ON u.tg_id = s.user_id
+    WHERE s.status='pending'
+      AND u.curator_idx=(SELECT idx FROM curators WHERE telegram_id=?)
+      AND (s.claimed_by IS NULL OR s.claim_expires_at < ?)
+      AND NOT EXISTS (
+          SELECT 1 FROM submissions a
+          WHERE a.user_id = s.user_id AND a.task_id = s.task_id AND a.status = 'accepted'
+      )
+    ORDER BY s.created_at ASC
+    LIMIT ?
+"""
+
+
+class ReviewPrefetcher:
+    """
+    Буфер подготовленных ответов для каждого куратора.
+
+    Пока куратор смотрит текущий ответ, в фоне читаются и разбираются следующие size штук.
+    Буфер только читает: ответ закрепляется за куратором в момент показа, поэтому
+    устаревшие элементы (проверены другим, переназначены) просто отбрасываются.
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        self._buffers: Dict[int, deque] = {}
+        self._refills: Dict[int, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def next(self, curator_tg: int) -> Optional[ReviewItem]:
+        """Следующий ответ из буфера, уже закреплённый за куратором, или None, если буфер пуст."""
+        buffer = self._buffers.get(curator_tg)
+        while buffer:
+            item = buffer.popleft()
+            if await claim_review_item(curator_tg, item.submission_id):
+                self.hits += 1
+                return item
+        self.misses += 1
+        return None
+
+    def schedule_refill(self, curator_tg: int):
+        if self._size <= 0:
+            return
+        task = self._refills.get(curator_tg)
+        if task is None or task.done():
+            self._refills[curator_tg] = asyncio.create_task(self._refill(curator_tg))
+
+    def drop(self, curator_tg: Optional[int] = None):
+        if curator_tg is None:
+            self._buffers.clear()
+        else:
+            self._buffers.pop(curator_tg, None)
+
+    async def stop(self):
+        for task in self._refills.values():
+            task.cancel()
+        await asyncio.gather(*self._refills.values(), return_exceptions=True)
+        self._refills.clear()
+        self._buffers.clear()
+
+    async def _refill(self, curator_tg: int):
+        buffer = self._buffers.setdefault(curator_tg, deque())
+        if len(buffer) >= self._size:
+            return
+        known = {item.submission_id for item in buffer}
+        try:
+            async with db_pool.read() as db:
+                cur = await db.execute(
+                    REVIEW_CANDIDATES_SQL,
+                    (curator_tg, datetime.utcnow().isoformat(), self._size + len(known)),
+                )
+                rows = [row for row in await cur.fetchall() if row[0] not in known][:self._size - len(buffer)]
+                media = await load_submission_media(db, [row[0] for row in rows])
+        except Exception:
+            logging.exception(f"❌ Не удалось подготовить очередь куратора {curator_tg}")
+            return
+        for row in rows:
+            if len(buffer) >= self._size:
+                break
+            buffer.append(build_review_item(*row, media[row[0]]))
+
+
+review_prefetcher = ReviewPrefetcher(REVIEW_PREFETCH)
+
+
+async def claim_review_item(curator_tg: int, submission_id: int) -> bool:
+    """Закрепляет подготовленный ответ, если он всё ещё ждёт проверки и участник по-прежнему у этого куратора."""
     now = datetime.utcnow().isoformat()
+    async with db_pool.write() as db:
+        cur = await db.execute(
+            f"""
+            UPDATE submissions SET claimed_by=?, claim_expires_at=?, shown_at=COALESCE(shown_at, ?)
+            WHERE id=? AND status='pending' AND {CLAIM_CONDITION}
+              AND user_id IN (
+                  SELECT tg_id FROM users
+                  WHERE curator_idx=(SELECT idx FROM curators WHERE telegram_id=?)
+              )
+              AND NOT EXISTS (
+                  SELECT 1 FROM submissions a
+                  WHERE a.user_id = submissions.user_id AND a.task_id = submissions.task_id
+                    AND a.status = 'accepted'
+              )
+            RETURNING id
+            """,
+            (curator_tg, claim_expiry(), now, submission_id, curator_tg, now, curator_tg),
+        )
+        return await cur.fetchone() is not None
+
+
+# ===== выдаём куратору следующий ответ =====
+@timed("send_next_submission")
+async def send_next_submission_to_curator(curator_tg: int):
+    item = await review_prefetcher.next(curator_tg)
+    if item is None:
+        item = await claim_next_submission(curator_tg)
+
+    if item is None:
+        await bot.send_message(curator_tg, "✅ Все задания проверены.")
+        sheets_exporter.trigger()
+        return
+
+    # пока куратор смотрит этот ответ, готовим следующие
+    review_prefetcher.schedule_refill(curator_tg)
+    await send_review_item(curator_tg, item)
+
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Получаем данные о задании
-        cur = await db.execute("SELECT user_id, task_id, status FROM submissions WHERE id=?", (submission_id,))
+async def claim_next_submission(curator_tg: int) -> Optional[ReviewItem]:
+    """Закрепляет за куратором самый старый доступный ответ из его очереди (путь без буфера)."""
+    now = datetime.utcnow().isoformat()
+    async with db_pool.write() as db:
+        cur = await db.execute(
+            CLAIM_NEXT_SQL,
+            (curator_tg, claim_expiry(), now, curator_tg, curator_tg, now),
+        )
         row = await cur.fetchone()
+
+        # нет заданий
         if not row:
-            await cb.answer("Задание не найдено", show_alert=True)
-            return
+            return None
 
-        user_id, task_id, status = row
+        submission_id, user_id, task_id, content_type, text = row
+        cur = await db.execute("SELECT fio FROM users WHERE tg_id=?", (user_id,))
+        user_name = (await cur.fetchone())[0]
+        media = await load_submission_media(db, [submission_id])
+    return build_review_item(submission_id, user_id, task_id, content_type, text, user_name, media[submission_id])
 
-        # Проверка: уже зачтено или нет
-        if status != "pending":
-            await cb.answer("Это задание уже проверено ⚠️", show_alert=True)
-            return
 
-        # Проверка: нет ли уже зачтённого варианта этого задания у пользователя
-        cur = await db.execute("""
-            SELECT COUNT(*) FROM submissions 
-            WHERE user_id=? AND task_id=? AND status='accepted'
-        """, (user_id, task_id))
-        already_accepted = (await cur.fetchone())[0] > 0
-        if already_accepted:
-            await db.execute(
-                "UPDATE submissions SET status='duplicate', updated_at=? WHERE id=?",
-                (now, submission_id),
-            )
-            await db.commit()
-            await cb.answer("⚠️ Это задание уже зачтено ранее. Баллы не начислены.", show_alert=True)
-            return
+# ===== захват и решение по ответу =====
+def claim_expiry() -> str:
+    return (datetime.utcnow() + timedelta(minutes=CLAIM_LEASE_MINUTES)).isoformat()
 
-        # Обновляем статус и начисляем баллы
-        await db.execute(
-            "UPDATE submissions SET status='accepted', updated_at=? WHERE id=?",
-            (now, submission_id),
+
+async def explain_unclaimable(db: aiosqlite.Connection, submission_id: int) -> str:
+    """Почему ответ нельзя взять: not_found, reviewed (уже решён) или claimed (закреплён за другим)."""
+    cur = await db.execute("SELECT status FROM submissions WHERE id=?", (submission_id,))
+    row = await cur.fetchone()
+    if not row:
+        return "not_found"
+    return "reviewed" if row[0] != "pending" else "claimed"
+
+
+async def claim_submission(submission_id: int, curator_tg: int) -> str:
+    """Закрепляет (или продлевает) ответ за куратором. Возвращает claimed_ok или причину отказа."""
+    now = datetime.utcnow().isoformat()
+    async with db_pool.write() as db:
+        cur = await db.execute(
+            f"UPDATE submissions SET claimed_by=?, claim_expires_at=? "
+            f"WHERE id=? AND status='pending' AND {CLAIM_CONDITION} RETURNING id",
+            (curator_tg, claim_expiry(), submission_id, curator_tg, now),
         )
-        points = task_by_id(task_id)['points']
-        await db.execute("UPDATE users SET points = points + ? WHERE tg_id=?", (points, user_id))
-        await db.commit()
+        if await cur.fetchone():
+            return "claimed_ok"
+        return await explain_unclaimable(db, submission_id)
+
+
+async def accept_submission(submission_id: int, curator_tg: int) -> Tuple[str, Optional[dict]]:
+    """
+    Зачитывает ответ одной транзакцией: смена статуса и начисление баллов.
+
+    Статус меняется одним условным UPDATE, поэтому из нескольких одновременных нажатий
+    срабатывает ровно одно. Если у участника уже есть зачтённый вариант, ответ помечается
+    как duplicate без начисления баллов.
+    """
+    async with db_pool.write() as db:
+        return await accept_submission_in(db, submission_id, curator_tg, datetime.utcnow().isoformat())
+
+
+async def reject_submission(submission_id: int, curator_tg: int, comment: str) -> Tuple[str, Optional[dict]]:
+    """Отклоняет ответ одним условным UPDATE; срабатывает, только если ответ всё ещё ждёт проверки этим куратором."""
+    async with db_pool.write() as db:
+        return await reject_submission_in(db, submission_id, curator_tg, comment, datetime.utcnow().isoformat())
+
+
+async def accept_submission_in(db: aiosqlite.Connection, submission_id: int, curator_tg: int,
+                               now: str) -> Tuple[str, Optional[dict]]:
+    cur = await db.execute(
+        f"""
+        UPDATE submissions
+        SET status = CASE WHEN EXISTS (
+                SELECT 1 FROM submissions a
+                WHERE a.user_id = submissions.user_id AND a.task_id = submissions.task_id
+                  AND a.status = 'accepted'
+            ) THEN 'duplicate' ELSE 'accepted' END,
+            updated_at=?, decided_at=?, claimed_by=?, claim_expires_at=NULL
+        WHERE id=? AND status='pending' AND {CLAIM_CONDITION}
+        RETURNING user_id, task_id, status
+        """,
+        (now, now, curator_tg, submission_id, curator_tg, now),
+    )
+    row = await cur.fetchone()
+    if not row:
+        return await explain_unclaimable(db, submission_id), None
+    user_id, task_id, status = row
+    review = {"user_id": user_id, "task_id": task_id}
+    if status == "duplicate":
+        return "duplicate", review
+
+    points = task_by_id(task_id)['points']
+    cur = await db.execute(
+        "UPDATE users SET points = points + ? WHERE tg_id=? RETURNING points", (points, user_id))
+    review["points"] = points
+    review["new_points"] = (await cur.fetchone())[0]
+    return "accepted", review
+
+
+async def reject_submission_in(db: aiosqlite.Connection, submission_id: int, curator_tg: int, comment: str,
+                               now: str) -> Tuple[str, Optional[dict]]:
+    cur = await db.execute(
+        f"UPDATE submissions SET status='rejected', curator_comment=?, updated_at=?, decided_at=?, "
+        f"claimed_by=?, claim_expires_at=NULL "
+        f"WHERE id=? AND status='pending' AND {CLAIM_CONDITION} RETURNING user_id, task_id",
+        (comment, now, now, curator_tg, submission_id, curator_tg, now),
+    )
+    row = await cur.fetchone()
+    if not row:
+        return await explain_unclaimable(db, submission_id), None
+    return "rejected", {"user_id": row[0], "task_id": row[1]}
+
+
+# ===== куратор зачёл =====
+@dp.callback_query(lambda c: c.data.startswith("cur_accept_"))
+async def curator_accept(cb: types.CallbackQuery):
+    submission_id = int(cb.data.split('_')[-1])
+    curator_tg = cb.from_user.id
+
+    outcome, review = await accept_submission(submission_id, curator_tg)
+    if outcome in ("accepted", "duplicate"):
+        user_state_cache.invalidate(review["user_id"])
 
-        cur2 = await db.execute("SELECT points FROM users WHERE tg_id=?", (user_id,))
-        new_points = (await cur2.fetchone())[0]
+    if outcome == "not_found":
+        await cb.answer("Задание не найдено", show_alert=True)
+        return
+    if outcome == "reviewed":
+        await cb.answer("Это задание уже проверено ⚠️", show_alert=True)
+        return
+    if outcome == "claimed":
+        await cb.answer("Это задание сейчас проверяет другой куратор ⚠️", show_alert=True)
+        return
+    if outcome == "duplicate":
+        await cb.answer("⚠️ Это задание уже зачтено ранее. Баллы не начислены.", show_alert=True)
+        return
+
+    user_id, task_id, points, new_points = review["user_id"], review["task_id"], review["points"], review["new_points"]
 
     # Уведомляем участника
     await bot.send_message(user_id, f"✅ Ваше задание {task_id} зачтено. +{points} баллов. Всего: {new_points}")
@@ -1561,17 +3017,17 @@ async def curator_accept(cb: types.CallbackQuery):
 async def curator_reject(cb: types.CallbackQuery, state: FSMContext):
     submission_id = int(cb.data.split('_')[-1])
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT status FROM submissions WHERE id=?", (submission_id,))
-        row = await cur.fetchone()
-        if not row:
-            await cb.answer("Задание не найдено", show_alert=True)
-            return
-
-        status = row[0]
-        if status != "pending":
-            await cb.answer("Это задание уже проверено ⚠️", show_alert=True)
-            return
+    # продлеваем аренду, пока куратор пишет причину отказа
+    outcome = await claim_submission(submission_id, cb.from_user.id)
+    if outcome == "not_found":
+        await cb.answer("Задание не найдено", show_alert=True)
+        return
+    if outcome == "reviewed":
+        await cb.answer("Это задание уже проверено ⚠️", show_alert=True)
+        return
+    if outcome == "claimed":
+        await cb.answer("Это задание сейчас проверяет другой куратор ⚠️", show_alert=True)
+        return
 
     # убираем клавиатуру, чтобы нельзя было жать повторно
     try:
@@ -1590,18 +3046,21 @@ async def curator_reject(cb: types.CallbackQuery, state: FSMContext):
 @dp.message()
 async def handle_curator_reject_reason(message: types.Message, state: FSMContext):
     data = await state.get_data()
+    page = data.get("batch_review")
+    if page and page.get("awaiting_reason"):
+        await finish_batch_review(message.from_user.id, page, message.text, state)
+        return
     submission_id = data.get("reject_submission")
     if not submission_id:
         return  # это обычное сообщение, не причина отклонения
 
-    now = datetime.utcnow().isoformat()
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT user_id, task_id FROM submissions WHERE id=?", (submission_id,))
-        user_id, task_id = await cur.fetchone()
-        await db.execute(
-            "UPDATE submissions SET status='rejected', curator_comment=?, updated_at=? WHERE id=?",
-            (message.text, now, submission_id))
-        await db.commit()
+    outcome, review = await reject_submission(submission_id, message.from_user.id, message.text)
+    if outcome != "rejected":
+        await state.clear()
+        await message.answer("Это задание уже проверено или его забрал другой куратор ⚠️")
+        return
+    user_id, task_id = review["user_id"], review["task_id"]
+    user_state_cache.invalidate(user_id)
 
     await bot.send_message(user_id, f"Ваше задание {task_id} не зачтено ❌\nПричина: {message.text}")
     await message.answer("Комментарий отправлен участнику ✅")
@@ -1611,66 +3070,428 @@ async def handle_curator_reject_reason(message: types.Message, state: FSMContext
     await send_next_submission_to_curator(message.from_user.id)
 
 
-def get_gs_client():
-    scope = ["https://spreadsheets.google.com/feeds",
-             "https://www.googleapis.com/auth/spreadsheets",
-             "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name("credentials.json", scope)
-    return gspread.authorize(creds)
+# ===== пакетная проверка текстовых ответов =====
+TEXT_TASK_IDS = [t["id"] for t in TASKS if t["type"] == "text"]
+BATCH_ANSWER_PREVIEW = 3500  # символов текста ответов на страницу (лимит сообщения 4096)
+BATCH_MARKS = {None: "⏳", "accepted": "✅", "rejected": "❌"}
+
+
+async def claim_batch_page(curator_tg: int) -> List[tuple]:
+    """Закрепляет за куратором до BATCH_REVIEW_SIZE самых старых текстовых ответов одним UPDATE."""
+    now = datetime.utcnow().isoformat()
+    task_marks = ",".join("?" * len(TEXT_TASK_IDS))
+    async with db_pool.write() as db:
+        cur = await db.execute(
+            f"""
+            UPDATE submissions SET claimed_by=?, claim_expires_at=?, shown_at=COALESCE(shown_at, ?)
+            WHERE id IN (
+                SELECT s.id
+                FROM submissions s
+                JOIN users u ON u.tg_id = s.user_id
+                WHERE s.status='pending' AND s.content_type='text' AND s.task_id IN ({task_marks})
+                  AND u.curator_idx=(SELECT idx FROM curators WHERE telegram_id=?)
+                  AND (s.claimed_by IS NULL OR s.claimed_by = ? OR s.claim_expires_at < ?)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM submissions a
+                      WHERE a.user_id = s.user_id AND a.task_id = s.task_id AND a.status = 'accepted'
+                  )
+                ORDER BY s.created_at ASC
+                LIMIT ?
+            )
+            RETURNING id, user_id, task_id, text
+            """,
+            (curator_tg, claim_expiry(), now, *TEXT_TASK_IDS, curator_tg, curator_tg, now, BATCH_REVIEW_SIZE),
+        )
+        rows = await cur.fetchall()
+        if not rows:
+            return []
+        user_ids = {r[1] for r in rows}
+        cur = await db.execute(
+            f"SELECT tg_id, fio FROM users WHERE tg_id IN ({','.join('?' * len(user_ids))})", tuple(user_ids))
+        names = dict(await cur.fetchall())
+    return [(sid, user_id, task_id, text or "", names.get(user_id, "?")) for sid, user_id, task_id, text in
+            sorted(rows)]
+
+
+def batch_page_text(rows: List[tuple]) -> str:
+    limit = max(BATCH_ANSWER_PREVIEW // len(rows), 100)
+    lines = [f"📝 Пакетная проверка: {len(rows)} текстовых ответов", ""]
+    for n, (sid, user_id, task_id, content, fio) in enumerate(rows, 1):
+        answer = content if len(content) <= limit else content[:limit] + "…"
+        lines.append(f"{n}. Задание {task_id} · {fio} (ID {sid})\n{answer}\n")
+    lines.append("Нажимайте номер ответа: ⏳ → ✅ → ❌ → ⏳")
+    return "\n".join(lines)
+
+
+def batch_page_kb(page: dict) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    for n, sid in enumerate(page["ids"], 1):
+        mark = BATCH_MARKS[page["decisions"].get(str(sid))]
+        builder.button(text=f"{n} {mark}", callback_data=f"batch_t_{sid}")
+    builder.adjust(5)
+    builder.row(types.InlineKeyboardButton(text="✅ Остальные зачесть и сохранить", callback_data="batch_all"))
+    builder.row(types.InlineKeyboardButton(text="💾 Сохранить", callback_data="batch_save"))
+    return builder.as_markup()
+
+
+async def send_batch_page(curator_tg: int, state: FSMContext):
+    rows = await claim_batch_page(curator_tg)
+    if not rows:
+        await state.update_data(batch_review=None)
+        sheets_exporter.trigger()
+        await bot.send_message(curator_tg, "✅ Текстовых ответов на проверку нет.",
+                               reply_markup=curator_start_check_kb())
+        return
+    page = {"ids": [r[0] for r in rows], "decisions": {}}
+    msg = await bot.send_message(curator_tg, batch_page_text(rows), reply_markup=batch_page_kb(page))
+    page["message_id"] = msg.message_id
+    await state.update_data(batch_review=page)
+
+
+@dp.callback_query(lambda c: c.data == "batch_start")
+async def batch_start(cb: types.CallbackQuery, state: FSMContext):
+    await cb.answer()
+    await send_batch_page(cb.from_user.id, state)
+
+
+@dp.callback_query(lambda c: c.data.startswith("batch_t_"))
+async def batch_toggle(cb: types.CallbackQuery, state: FSMContext):
+    page = (await state.get_data()).get("batch_review")
+    sid = int(cb.data.split("_")[-1])
+    if not page or sid not in page["ids"] or page.get("message_id") != cb.message.message_id:
+        await cb.answer("Эта страница уже сохранена", show_alert=True)
+        return
+    order = [None, "accepted", "rejected"]
+    current = page["decisions"].get(str(sid))
+    decision = order[(order.index(current) + 1) % len(order)]
+    if decision is None:
+        page["decisions"].pop(str(sid), None)
+    else:
+        page["decisions"][str(sid)] = decision
+    await state.update_data(batch_review=page)
+    await cb.message.edit_reply_markup(reply_markup=batch_page_kb(page))
+    await cb.answer()
 
 
-async def export_to_google_sheets():
+@dp.callback_query(lambda c: c.data in ("batch_all", "batch_save"))
+async def batch_save(cb: types.CallbackQuery, state: FSMContext):
+    page = (await state.get_data()).get("batch_review")
+    if not page or page.get("message_id") != cb.message.message_id:
+        await cb.answer("Эта страница уже сохранена", show_alert=True)
+        return
+    if cb.data == "batch_all":
+        for sid in page["ids"]:
+            page["decisions"].setdefault(str(sid), "accepted")
     try:
-        client = get_gs_client()
+        await cb.message.edit_reply_markup()
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e).lower():
+            raise
+    await cb.answer()
+
+    rejected = [sid for sid, d in page["decisions"].items() if d == "rejected"]
+    if rejected:
+        # решения сохраняются вместе с причиной отказа, одной транзакцией
+        page["awaiting_reason"] = True
+        await state.update_data(batch_review=page)
+        await cb.message.answer(f"Напишите причину отказа (одна для {len(rejected)} отклонённых ответов):")
+        return
+    await finish_batch_review(cb.from_user.id, page, None, state)
 
-        try:
-            spreadsheet = client.open(SPREADSHEET_NAME)
-        except gspread.SpreadsheetNotFound:
-            spreadsheet = client.create(SPREADSHEET_NAME)
-            spreadsheet.share('', perm_type='anyone', role='writer')
 
+async def apply_batch_decisions(curator_tg: int, page: dict, comment: Optional[str]) -> List[Tuple[str, dict]]:
+    """Сохраняет все решения страницы в одной транзакции и снимает закрепление с нерешённых ответов."""
+    now = datetime.utcnow().isoformat()
+    results = []
+    async with db_pool.write() as db:
+        for sid in page["ids"]:
+            decision = page["decisions"].get(str(sid))
+            if decision == "accepted":
+                outcome, review = await accept_submission_in(db, sid, curator_tg, now)
+            elif decision == "rejected":
+                outcome, review = await reject_submission_in(db, sid, curator_tg, comment, now)
+            else:
+                await db.execute(
+                    "UPDATE submissions SET claimed_by=NULL, claim_expires_at=NULL "
+                    "WHERE id=? AND status='pending' AND claimed_by=?",
+                    (sid, curator_tg),
+                )
+                continue
+            if review:
+                results.append((outcome, review))
+    return results
+
+
+async def finish_batch_review(curator_tg: int, page: dict, comment: Optional[str], state: FSMContext):
+    results = await apply_batch_decisions(curator_tg, page, comment)
+    await state.update_data(batch_review=None)
+    user_state_cache.invalidate(*{review["user_id"] for _, review in results})
+
+    counts = {"accepted": 0, "rejected": 0, "duplicate": 0}
+    for outcome, review in results:
+        counts[outcome] += 1
+        if outcome == "accepted":
+            text = (f"✅ Ваше задание {review['task_id']} зачтено. "
+                    f"+{review['points']} баллов. Всего: {review['new_points']}")
+        elif outcome == "rejected":
+            text = f"Ваше задание {review['task_id']} не зачтено ❌\nПричина: {comment}"
+        else:
+            continue
         try:
-            sheet = spreadsheet.worksheet(SHEET_NAME)
-        except gspread.WorksheetNotFound:
-            sheet = spreadsheet.add_worksheet(title=SHEET_NAME, rows="300", cols="20")
-
-        async with aiosqlite.connect(DB_PATH) as db:
-            cur = await db.execute("SELECT tg_id, fio, acad_group, points FROM users")
-            users = await cur.fetchall()
-            rows = []
-            for u in users:
-                tg_id, fio, acad_group, points = u
-                cur2 = await db.execute(
-                    "SELECT task_id FROM submissions WHERE user_id=? AND status='accepted'", (tg_id,))
-                tasks = await cur2.fetchall()
-                task_list = ",".join(str(t[0]) for t in tasks)
-                rows.append([fio, acad_group, points, task_list])
-
-        # сортировка по баллам
-        rows.sort(key=lambda r: r[2], reverse=True)
-
-        # добавляем места
-        rows_with_rank = []
-        rank = 1
-        for i, row in enumerate(rows):
-            if i > 0 and row[2] < rows[i - 1][2]:
-                rank = i + 1
-            rows_with_rank.append([rank] + row)
-
-        header = ["Место", "ФИО", "Группа", "Баллы", "Выполненные задания"]
+            await bot.send_message(review["user_id"], text)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            logging.warning(f"⚠️ Не удалось уведомить участника {review['user_id']}: {e}")
+
+    skipped = sum(1 for sid in page["ids"] if page["decisions"].get(str(sid))) - len(results)
+    summary = f"💾 Сохранено: зачтено {counts['accepted']}, не зачтено {counts['rejected']}"
+    if counts["duplicate"]:
+        summary += f", дубликатов {counts['duplicate']}"
+    if skipped:
+        summary += f", уже проверены другими {skipped}"
+    await bot.send_message(curator_tg, summary)
+    await send_batch_page(curator_tg, state)
+
+
+# ===== общий клиент Google Sheets =====
+_gs_lock = threading.Lock()
+_gs_credentials: Optional[service_account.Credentials] = None
+_gs_client: Optional[gspread.Client] = None
+_gs_sheet: Optional[gspread.Worksheet] = None
+_gs_snapshot: Optional[list] = None  # таблица, записанная последним экспортом
+
+
+def get_gs_client() -> gspread.Client:
+    """
+    Возвращает авторизованный клиент gspread, общий для всех экспортов.
+
+    credentials.json читается один раз; токен доступа кэшируется в объекте credentials
+    и обновляется заранее, если до истечения осталось меньше GS_TOKEN_REFRESH_MARGIN.
+    """
+    global _gs_credentials, _gs_client
+    with _gs_lock:
+        if _gs_client is None:
+            _gs_credentials = service_account.Credentials.from_service_account_file(
+                GS_CREDENTIALS_FILE, scopes=GS_SCOPES)
+            _gs_client = gspread.authorize(_gs_credentials)
+            logging.info("🔑 Клиент Google Sheets авторизован")
+
+        expiry = _gs_credentials.expiry  # naive UTC, как и datetime.utcnow()
+        if not _gs_credentials.valid or expiry is None or expiry - datetime.utcnow() < GS_TOKEN_REFRESH_MARGIN:
+            _gs_credentials.refresh(GoogleAuthRequest())
+        return _gs_client
+
+
+def get_rating_sheet() -> gspread.Worksheet:
+    """Лист рейтинга; таблица и лист ищутся (или создаются) один раз и затем переиспользуются."""
+    global _gs_sheet
+    client = get_gs_client()
+    if _gs_sheet is not None:
+        return _gs_sheet
+
+    try:
+        spreadsheet = client.open(SPREADSHEET_NAME)
+    except gspread.SpreadsheetNotFound:
+        spreadsheet = client.create(SPREADSHEET_NAME)
+        spreadsheet.share('', perm_type='anyone', role='writer')
+
+    try:
+        sheet = spreadsheet.worksheet(SHEET_NAME)
+    except gspread.WorksheetNotFound:
+        sheet = spreadsheet.add_worksheet(title=SHEET_NAME, rows="300", cols="20")
+
+    _gs_sheet = sheet
+    return sheet
+
+
+def reset_rating_sheet():
+    """Сбрасывает кэш листа и снимок — например, если лист удалили или запись не удалась."""
+    global _gs_sheet, _gs_snapshot
+    _gs_sheet = None
+    _gs_snapshot = None
+
+
+# Рейтинг одним проходом: место (RANK — при равных баллах одно место, следующее с пропуском),
+# ФИО, группа, баллы и список зачтённых заданий через запятую.
+RANKING_SQL = """
+    SELECT RANK() OVER (ORDER BY u.points DESC) AS place,
+           u.fio, u.acad_group, u.points, COALESCE(a.tasks, '') AS tasks
+    FROM users u
+    LEFT JOIN (
+        SELECT user_id, GROUP_CONCAT(task_id, ',') AS tasks
+        FROM (SELECT user_id, task_id FROM submissions WHERE status='accepted' ORDER BY user_id, task_id)
+        GROUP BY user_id
+    ) a ON a.user_id = u.tg_id
+    ORDER BY u.points DESC, u.tg_id
+"""
+
+
+async def fetch_ranking_rows() -> list:
+    async with db_pool.read() as db:
+        cur = await db.execute(RANKING_SQL)
+        return [list(row) for row in await cur.fetchall()]
+
+
+@timed("build_ranking_values")
+async def build_ranking_values() -> list:
+    """Собирает таблицу рейтинга (с заголовком) из базы — выполняется в основном event loop."""
+    header = ["Место", "ФИО", "Группа", "Баллы", "Выполненные задания"]
+    return [header] + await fetch_ranking_rows()
+
+
+@dataclass
+class ExportResult:
+    rows: int  # участников в рейтинге
+    mode: str  # "full", "diff" или "noop"
+    cells: int  # ячеек записано в таблицу
+
+
+def diff_ranking(old: list, new: list) -> List[dict]:
+    """
+    Диапазоны для batch_update, превращающие таблицу old в new.
+
+    Для каждой изменившейся строки отправляется отрезок от первой до последней отличающейся
+    ячейки; строки, которых больше нет, затираются пустыми значениями.
+    """
+    updates = []
+    for r in range(max(len(old), len(new))):
+        old_row = old[r] if r < len(old) else []
+        new_row = new[r] if r < len(new) else []
+        if old_row == new_row:
+            continue
+        width = max(len(old_row), len(new_row))
+        padded_old = list(old_row) + [""] * (width - len(old_row))
+        padded_new = list(new_row) + [""] * (width - len(new_row))
+        changed = [c for c in range(width) if padded_old[c] != padded_new[c]]
+        if not changed:
+            continue
+        lo, hi = changed[0], changed[-1]
+        updates.append({
+            "range": f"{rowcol_to_a1(r + 1, lo + 1)}:{rowcol_to_a1(r + 1, hi + 1)}",
+            "values": [padded_new[lo:hi + 1]],
+        })
+    return updates
+
+
+def push_ranking_to_sheet(values: list) -> ExportResult:
+    """
+    Синхронная запись рейтинга через gspread — вызывается только в потоке экспорта.
+
+    Отправляются только изменившиеся ячейки одним batch_update; лист переписывается целиком
+    при первом экспорте и когда меняется слишком много строк (например, сильно сдвинулся порядок).
+    """
+    global _gs_snapshot
+    sheet = get_rating_sheet()
+    rows = len(values) - 1
+    try:
+        if _gs_snapshot is not None:
+            updates = diff_ranking(_gs_snapshot, values)
+            if len(updates) <= EXPORT_FULL_REWRITE_RATIO * max(len(values), 1):
+                if updates:
+                    sheet.batch_update(updates)
+                _gs_snapshot = values
+                cells = sum(len(u["values"][0]) for u in updates)
+                return ExportResult(rows, "diff" if updates else "noop", cells)
 
         sheet.clear()
-        sheet.update(values=[header] + rows_with_rank, range_name="A1")
+        sheet.update(values=values, range_name="A1")
+        _gs_snapshot = values
+        return ExportResult(rows, "full", sum(len(row) for row in values))
+    except gspread.exceptions.APIError:
+        reset_rating_sheet()
+        raise
 
-        logging.info("✅ Google Sheets обновлены (автоматически).")
 
-    except Exception as e:
-        logging.error(f"❌ Ошибка при обновлении Google Sheets: {e}")
+class SheetsExportWorker:
+    """
+    Фоновый экспорт рейтинга в Google Sheets.
+
+    Запросы на экспорт не выполняются сразу, а будят воркер: все триггеры, пришедшие за
+    EXPORT_COALESCE_SECONDS, схлопываются в один экспорт. Данные читаются из базы в event loop,
+    а блокирующие вызовы gspread выполняются в отдельном потоке, поэтому бот не замирает.
+    """
+
+    def __init__(self, coalesce_seconds: float):
+        self.coalesce_seconds = coalesce_seconds
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sheets-export")
+        self._wakeup = asyncio.Event()
+        self._waiters: List[asyncio.Future] = []
+        self._task: Optional[asyncio.Task] = None
+        self.triggers = 0
+        self.exports = 0
+        self.cells_written = 0
+        self.last_result: Optional[ExportResult] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._executor.shutdown(wait=False)
+
+    def trigger(self):
+        """Запросить экспорт в фоне (например, когда куратор разобрал очередь)."""
+        self.triggers += 1
+        self._wakeup.set()
+
+    async def export_now(self) -> ExportResult:
+        """Запросить экспорт и дождаться результата."""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self._wakeup.set()
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._wakeup.wait()
+            # если никто не ждёт результата — даём накопиться пачке триггеров
+            if not self._waiters:
+                await asyncio.sleep(self.coalesce_seconds)
+            self._wakeup.clear()
+            waiters, self._waiters = self._waiters, []
+
+            try:
+                values = await build_ranking_values()
+                result = await loop.run_in_executor(self._executor, push_ranking_to_sheet, values)
+            except Exception as e:
+                logging.error(f"❌ Ошибка при обновлении Google Sheets: {e}")
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                continue
+
+            self.exports += 1
+            self.cells_written += result.cells
+            self.last_result = result
+            logging.info(f"✅ Google Sheets обновлены (экспорт #{self.exports}, режим {result.mode}, "
+                         f"ячеек записано: {result.cells}, всего: {self.cells_written}).")
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(result)
+
+
+sheets_exporter = SheetsExportWorker(EXPORT_COALESCE_SECONDS)
+
+
+# фоновые задачи, которые нужно остановить до закрытия пула БД
+background_tasks: List[asyncio.Task] = []
 
 
 async def on_startup(dp):
+    await db_pool.open()
     await init_db()
-    asyncio.create_task(backup_scheduler())
+    fsm_storage.start()
+    sheets_exporter.start()
+    background_tasks.append(asyncio.create_task(broadcast_worker()))
+    background_tasks.append(asyncio.create_task(backup_scheduler()))
+    background_tasks.append(asyncio.create_task(dedup_scheduler()))
 
     # регистрируем команды для удобства
     commands = [
@@ -1681,14 +3502,83 @@ async def on_startup(dp):
     await bot.set_my_commands(commands)
 
 
+async def on_shutdown(dp):
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await media_groups.stop()
+    await review_prefetcher.stop()
+    await sheets_exporter.stop()
+    await fsm_storage.close()
+    await db_pool.close()
+
+
+async def health(request: web.Request) -> web.Response:
+    try:
+        async with db_pool.read() as db:
+            await db.execute("SELECT 1")
+    except Exception as e:
+        logging.warning(f"⚠️ Health-check не прошёл: {e}")
+        return web.json_response({"status": "error", "db": str(e)}, status=503)
+    return web.json_response({"status": "ok"})
+
+
+async def run_polling():
+    # снимаем webhook, если бот раньше работал в webhook-режиме, иначе getUpdates вернёт конфликт
+    await bot.delete_webhook()
+    await dp.start_polling(bot)
+
+
+async def run_webhook():
+    handler = SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET)
+    app = web.Application()
+    handler.register(app, path=WEBHOOK_PATH)
+    app.router.add_get("/health", health)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT)
+    await site.start()
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logging.info(f"🌐 Webhook слушает {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+        # перестаём принимать запросы, но даём начатым обработчикам закончить работу с базой
+        await site.stop()
+        in_flight = list(handler._background_feed_update_tasks)
+        if in_flight:
+            logging.info(f"⏳ Ждём завершения {len(in_flight)} обработчиков")
+            _, pending = await asyncio.wait(in_flight, timeout=WEBHOOK_DRAIN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        await runner.cleanup()
+
+
 # Запуск
 async def main():
-    await init_db()
     await on_startup(dp)
     print("Bot started")
     try:
-        await dp.start_polling(bot)
+        if WEBHOOK_URL:
+            await run_webhook()
+        else:
+            await run_polling()
     finally:
+        await on_shutdown(dp)
         await bot.session.close()
 
 
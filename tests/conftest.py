@@ -0,0 +1,35 @@
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# main читает tasks_data.json и настройки при импорте
+ROOT = Path(__file__).resolve().parent.parent
+os.chdir(ROOT)
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.gettempdir(), "test_bot.db"))
+
+import main  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path) -> str:
+    return str(tmp_path / "bot.db")
+
+
+@pytest.fixture
+def run(db_path, monkeypatch):
+    """Выполняет корутины теста в одном цикле событий с открытым пулом на чистой базе."""
+    loop = asyncio.new_event_loop()
+    pool = main.DBPool(db_path, 2)
+    monkeypatch.setattr(main, "db_pool", pool)
+    main.user_state_cache.clear()
+    loop.run_until_complete(pool.open())
+    loop.run_until_complete(main.init_db())
+    yield loop.run_until_complete
+    loop.run_until_complete(pool.close())
+    loop.close()
@@ -0,0 +1,43 @@
+import asyncio
+
+import main
+
+DELAY = 0.1
+
+
+def test_late_part_postpones_flush_and_parts_are_ordered():
+    flushes = []
+
+    async def on_flush(items):
+        flushes.append(items)
+
+    async def scenario():
+        albums = main.MediaGroupAggregator(DELAY)
+        albums.add(1, "album", 5, "e", on_flush)
+        albums.add(1, "album", 3, "c", on_flush)
+        # часть 4 приходит позже, но до истечения паузы — сборка откладывается ещё на DELAY
+        await asyncio.sleep(DELAY * 0.6)
+        albums.add(1, "album", 4, "d", on_flush)
+        await asyncio.sleep(DELAY * 0.6)
+        assert flushes == []
+        await asyncio.sleep(DELAY * 2)
+
+    asyncio.run(scenario())
+    assert flushes == [["c", "d", "e"]]
+
+
+def test_stop_flushes_pending_groups():
+    flushes = []
+
+    async def on_flush(items):
+        flushes.append(items)
+
+    async def scenario():
+        albums = main.MediaGroupAggregator(60)
+        albums.add(1, "album", 2, "b", on_flush)
+        albums.add(2, "album", 1, "x", on_flush)
+        albums.add(1, "album", 1, "a", on_flush)
+        await albums.stop()
+
+    asyncio.run(scenario())
+    assert sorted(flushes) == [["a", "b"], ["x"]]
@@ -0,0 +1,61 @@
+import asyncio
+import sqlite3
+
+import main
+
+# схема до появления миграций
+BASELINE_SCHEMA = """
+CREATE TABLE curators (idx INTEGER PRIMARY KEY AUTOINCREMENT, fio TEXT, telegram_id INTEGER);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE users (tg_id INTEGER PRIMARY KEY, fio TEXT, acad_group TEXT, curator_idx INTEGER,
+                    points INTEGER DEFAULT 0);
+CREATE TABLE submissions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, task_id INTEGER, status TEXT,
+                          content_type TEXT, content TEXT, curator_comment TEXT, created_at TEXT, updated_at TEXT);
+INSERT INTO meta (key, value) VALUES ('next_curator_idx', '1');
+INSERT INTO curators (fio, telegram_id) VALUES ('Куратор', 500);
+INSERT INTO users (tg_id, fio, acad_group, curator_idx) VALUES (1, 'Участник', 'Группа', 1);
+INSERT INTO submissions (user_id, task_id, status, content_type, content, created_at, updated_at)
+VALUES (1, 1, 'pending', 'photo_text', 'photo:abc|text:ответ | с чертой', '2024-01-01', '2024-01-01');
+"""
+
+
+async def writer_plan_problems():
+    async with main.db_pool.write() as db:
+        return await main.check_hot_query_plans(db)
+
+
+def test_hot_queries_use_indexes(run):
+    assert run(writer_plan_problems()) == []
+
+
+def test_hot_queries_use_indexes_after_upgrade(db_path, monkeypatch):
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+
+    async def scenario():
+        pool = main.DBPool(db_path, 2)
+        monkeypatch.setattr(main, "db_pool", pool)
+        # читатели открываются до миграций, как при первом запуске новой версии
+        await pool.open()
+        try:
+            await main.init_db()
+            problems = await writer_plan_problems()
+            async with pool.write() as db:
+                cur = await db.execute("SELECT text FROM submissions")
+                text = (await cur.fetchone())[0]
+        finally:
+            await pool.close()
+        return problems, text
+
+    problems, text = asyncio.run(scenario())
+    assert problems == []
+    assert text == "ответ | с чертой"
+
+
+def test_full_scan_is_reported(run, monkeypatch):
+    monkeypatch.setattr(main, "HOT_QUERIES", {
+        "by_text": ("SELECT id FROM submissions WHERE text=?", ("",)),
+        "by_group": ("SELECT tg_id FROM users u WHERE acad_group=?", ("",)),
+    })
+    problems = run(writer_plan_problems())
+    assert [p.split(":")[0] for p in problems] == ["by_text", "by_group"]
@@ -0,0 +1,71 @@
+import asyncio
+from collections import Counter
+
+import main
+
+CURATOR_TG = 500
+USER_ID = 1
+
+
+async def seed_pending(task_id: int = 1) -> int:
+    async with main.db_pool.write() as db:
+        await db.execute("INSERT INTO curators (idx, fio, telegram_id) VALUES (1, 'Куратор', ?)", (CURATOR_TG,))
+        await db.execute("INSERT INTO users (tg_id, fio, acad_group, curator_idx) VALUES (?, 'Участник', 'Группа', 1)",
+                         (USER_ID,))
+    await main.save_submission(USER_ID, task_id, "text", "ответ")
+    async with main.db_pool.read() as db:
+        cur = await db.execute("SELECT id FROM submissions WHERE user_id=?", (USER_ID,))
+        return (await cur.fetchone())[0]
+
+
+async def user_points() -> int:
+    async with main.db_pool.read() as db:
+        cur = await db.execute("SELECT points FROM users WHERE tg_id=?", (USER_ID,))
+        return (await cur.fetchone())[0]
+
+
+def test_parallel_accepts_award_points_once(run):
+    submission_id = run(seed_pending())
+
+    async def accept_ten_times():
+        results = await asyncio.gather(*(main.accept_submission(submission_id, CURATOR_TG) for _ in range(10)))
+        return Counter(outcome for outcome, _ in results)
+
+    assert run(accept_ten_times()) == {"accepted": 1, "reviewed": 9}
+    assert run(user_points()) == main.task_by_id(1)["points"]
+
+
+def test_parallel_accept_and_reject_one_wins(run):
+    submission_id = run(seed_pending())
+
+    async def accept_and_reject():
+        return await asyncio.gather(
+            main.accept_submission(submission_id, CURATOR_TG),
+            main.reject_submission(submission_id, CURATOR_TG, "нет пояснения"),
+        )
+
+    outcomes = sorted(outcome for outcome, _ in run(accept_and_reject()))
+    assert outcomes in (["accepted", "reviewed"], ["rejected", "reviewed"])
+
+
+def test_reclaim_keeps_first_shown_at(run):
+    submission_id = run(seed_pending())
+
+    async def shown_at():
+        async with main.db_pool.read() as db:
+            cur = await db.execute("SELECT shown_at FROM submissions WHERE id=?", (submission_id,))
+            return (await cur.fetchone())[0]
+
+    async def expire_claim():
+        async with main.db_pool.write() as db:
+            await db.execute("UPDATE submissions SET claim_expires_at='2000-01-01' WHERE id=?", (submission_id,))
+
+    assert run(main.claim_next_submission(CURATOR_TG)).submission_id == submission_id
+    first = run(shown_at())
+    assert first is not None
+
+    # закрепление истекло, ответ выдаётся снова — время первого показа не меняется
+    for claim in (main.claim_next_submission(CURATOR_TG), main.claim_review_item(CURATOR_TG, submission_id)):
+        run(expire_claim())
+        assert run(claim)
+        assert run(shown_at()) == first